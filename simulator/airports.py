@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import os
+import json
+import math
+import datetime
+from entities import RunwayStatus, WeatherCondition
+
+# JSON airport catalog, or empty for the built-in one next to this file
+AIRPORT_CATALOG = os.getenv('SIM_AIRPORT_CATALOG', '')
+BUILTIN_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'airports.json')
+
+# Catalog airports to simulate: comma-separated codes, or "all"
+AIRPORTS = os.getenv('SIM_AIRPORTS', 'JFK')
+
+# Runway defaults for catalog entries that leave them out
+RUNWAY_DEFAULTS = {
+    'status': 'active',
+    'operation': 'landing',
+    'capacity': 90,
+    'maintenanceHours': 240
+}
+
+# Weather every airport starts with, unless its catalog entry overrides some of it
+WEATHER_DEFAULTS = {
+    'temperature': 22.4,
+    'windSpeed': 8.5,
+    'windDirection': 270,
+    'visibility': 10,
+    'precipitation': 0,
+    'cloudCoverage': 25,
+    'weatherAlert': False,
+    'condition': 'partly cloudy'
+}
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111320.0
+
+# One airport of the catalog: its code, location, runways and starting
+# weather. Each runway needs an id, unique across the catalog, a name and a
+# length in metres. Its centreline is either given as two [lat, lng] points
+# under "location", or laid out through the airport location from a compass
+# "heading". Status, operation, capacity and maintenanceHours fall back to
+# RUNWAY_DEFAULTS. The weather entity is WeatherCondition:<code> unless
+# "weatherId" names another one.
+class Airport:
+    def __init__(self, code, name, location, runways, weather=None, weatherId=None):
+        self.code = code
+        self.name = name
+        self.location = tuple(location)
+        self.runways = [dict(RUNWAY_DEFAULTS, **runway) for runway in runways]
+        self.weather = dict(WEATHER_DEFAULTS, **(weather or {}))
+        self.weather_id = weatherId or f"WeatherCondition:{code}"
+        self.runway_ids = [f"RunwayStatus:{runway['id']}" for runway in self.runways]
+
+    # Centreline of a runway without an explicit location
+    def _centreline(self, runway):
+        lat, lng = self.location
+        heading = math.radians(runway['heading'])
+        half = runway['length'] / 2 / METRES_PER_DEGREE
+        dlat = math.cos(heading) * half
+        dlng = math.sin(heading) * half / math.cos(math.radians(lat))
+        return [[round(lat - dlat, 4), round(lng - dlng, 4)], [round(lat + dlat, 4), round(lng + dlng, 4)]]
+
+    def create_runways(self, now, timestamp):
+        return [
+            RunwayStatus(
+                f"RunwayStatus:{runway['id']}", timestamp,
+                runwayId=runway['id'],
+                airport=self.code,
+                name=runway['name'],
+                length=runway['length'],
+                status=runway['status'],
+                operation=runway['operation'],
+                visibility=self.weather['visibility'],
+                surfaceCondition='dry',
+                nextScheduledMaintenance=(now + datetime.timedelta(hours=runway['maintenanceHours'])).isoformat(),
+                currentCapacity=runway['capacity'],
+                location={'type': 'LineString', 'coordinates': runway.get('location') or self._centreline(runway)}
+            )
+            for runway in self.runways
+        ]
+
+    def create_weather(self, timestamp):
+        return WeatherCondition(self.weather_id, timestamp, location=self.location, airport=self.code, **self.weather)
+
+# Airports of a JSON catalog by code, in catalog order
+def load_catalog(path=AIRPORT_CATALOG):
+    with open(path or BUILTIN_CATALOG, encoding='utf-8') as f:
+        airports = [Airport(**entry) for entry in json.load(f)]
+
+    catalog = {}
+    runway_ids = set()
+    for airport in airports:
+        if airport.code in catalog:
+            raise ValueError(f"Airport {airport.code} is listed twice in the catalog")
+        duplicates = runway_ids.intersection(airport.runway_ids)
+        if duplicates:
+            raise ValueError(f"Runways {', '.join(sorted(duplicates))} of {airport.code} are already used by another airport")
+        runway_ids.update(airport.runway_ids)
+        catalog[airport.code] = airport
+    return catalog
+
+# The catalog airports named by comma-separated codes, or all of them
+def select_airports(catalog, codes=AIRPORTS):
+    if codes.strip().lower() == 'all':
+        return dict(catalog)
+    selected = {}
+    for code in codes.split(','):
+        code = code.strip().upper()
+        if not code:
+            continue
+        if code not in catalog:
+            raise ValueError(f"Unknown airport: {code}. Available airports: {', '.join(catalog)}")
+        selected[code] = catalog[code]
+    if not selected:
+        raise ValueError("No airports selected")
+    return selected
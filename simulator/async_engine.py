@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import os
+import signal
+import asyncio
+from orion_client import BATCH_SIZE
+from metrics import TICK_SECONDS, ERRORS
+
+# Maximum number of Orion writes in flight at once
+MAX_IN_FLIGHT = int(os.getenv('ORION_MAX_IN_FLIGHT', '8'))
+
+# Runs simulation engines as coroutines. Each engine tick returns its changed
+# entities as {action_type: entities}, which are split into batches and handed
+# to the blocking send(entities, action_type) function on worker threads, with
+# at most max_in_flight batches being written at once. A slow Orion response
+# only holds up its own batch; engines only wait once the in-flight limit is
+# reached, or before sending deletes, which wait for the writes already in
+# flight so that a deleted entity is never written back by an earlier append.
+class AsyncEngine:
+    def __init__(self, send, clock, max_in_flight=MAX_IN_FLIGHT, batch_size=BATCH_SIZE):
+        self.send = send
+        self.clock = clock
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.semaphore = None
+        self.pending = set()
+
+    # Write one batch on a worker thread and free its in-flight slot
+    async def _write(self, batch, action_type):
+        try:
+            await asyncio.to_thread(self.send, batch, action_type)
+        except Exception as e:
+            ERRORS.inc('write')
+            print(f"Error writing to Orion: {e}")
+        finally:
+            self.semaphore.release()
+
+    # Schedule the writes for the changed entities of a tick
+    async def submit(self, changes):
+        for action_type, entities in changes.items():
+            if action_type == 'delete' and entities and self.pending:
+                await asyncio.wait(set(self.pending))
+            for start in range(0, len(entities), self.batch_size):
+                await self.semaphore.acquire()
+                task = asyncio.create_task(self._write(entities[start:start + self.batch_size], action_type))
+                self.pending.add(task)
+                task.add_done_callback(self.pending.discard)
+
+    # Tick one engine forever at a fixed rate of simulated time
+    async def _run_engine(self, name, tick, interval):
+        ticker = self.clock.ticker(interval, name)
+        while True:
+            try:
+                with TICK_SECONDS.time(name):
+                    changes = tick()
+                await self.submit(changes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ERRORS.inc(name)
+                print(f"Error in {name} simulation: {e}")
+            await asyncio.sleep(ticker.delay())
+
+    # Run (name, tick, interval) engines until SIGINT/SIGTERM, then cancel
+    # them and let the writes already in flight finish
+    async def run(self, engines):
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        tasks = [asyncio.create_task(self._run_engine(*engine)) for engine in engines]
+        try:
+            await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.pending:
+                await asyncio.wait(self.pending)
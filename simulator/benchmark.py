@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import resource
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import simulator
+from sinks import NullSink, create_sink
+from entities import set_profile, PROFILES
+from orion_client import OrionClient
+from orion_stub import OrionStub
+from generator import bootstrap
+
+# Upper bounds of the request latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# Targets the write path can be benchmarked against
+TARGETS = ['null', 'ndjson', 'stub', 'orion']
+
+# Sink the shard workers write to for each target
+SHARD_SINKS = {'null': 'null', 'ndjson': 'ndjson', 'stub': 'orion', 'orion': 'orion'}
+
+# Nearest-rank percentile of a list of numbers
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+# Count latencies (seconds) into LATENCY_BUCKETS, plus an overflow bucket
+def histogram(latencies):
+    counts = {f"le_{bound}ms": 0 for bound in LATENCY_BUCKETS}
+    counts['inf'] = 0
+    for latency in latencies:
+        ms = latency * 1000
+        for bound in LATENCY_BUCKETS:
+            if ms <= bound:
+                counts[f"le_{bound}ms"] += 1
+                break
+        else:
+            counts['inf'] += 1
+    return counts
+
+# Peak resident set size of this process in megabytes
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+# Time every batch write made through a sink. Each batch is at most one
+# /v2/op/update request, so for Orion and the stand-in this is the request latency.
+class TimedSink:
+    def __init__(self, sink):
+        self.sink = sink
+        self.latencies = []
+
+    def create(self, entity_data):
+        self.sink.create(entity_data)
+
+    def update(self, entity_data):
+        self.sink.update(entity_data)
+
+    def batch(self, entities, action_type='update', batch_size=None):
+        started = time.perf_counter()
+        self.sink.batch(entities, action_type, batch_size)
+        self.latencies.append(time.perf_counter() - started)
+
+    def close(self):
+        self.sink.close()
+
+# Build a fresh simulator world with the given number of flights, generated
+# from seed. Entities are created without writing anything and then
+# bulk-loaded into the target by `concurrency` writers.
+def setup_world(flight_count, target_sink, batch_size, concurrency=1, seed=None):
+    random.seed(seed)
+    simulator.flights.clear()
+    simulator.runways.clear()
+    simulator.weather_conditions.clear()
+    simulator.shards = None
+    simulator.sink = NullSink()
+    simulator.initialize_data(flight_count, seed=seed)
+
+    entities = (entity.to_ngsi() for group in (simulator.runways, simulator.weather_conditions, simulator.flights)
+                for entity in group.values())
+    bootstrap(entities, target_sink.batch, batch_size, concurrency)
+    simulator.sink = target_sink
+
+# Build a fresh simulator world with its flights split across shard_count
+# worker processes, which bootstrap and write their own flights into the
+# target through their own sinks. The runways and weather are bulk-loaded
+# into the target from this process. The world is generated from seed.
+def setup_sharded_world(args, client, profile, flight_count, shard_count, target_sink, batch_size, concurrency,
+                        seed=None):
+    random.seed(seed)
+    simulator.flights.clear()
+    simulator.runways.clear()
+    simulator.weather_conditions.clear()
+    simulator.sink = NullSink()
+    simulator.initialize_shards(shard_count, {
+        'airports': simulator.airports,
+        'shard_by': 'flight',
+        'orion_url': client.base_url if client is not None else simulator.ORION_URL,
+        'sink': SHARD_SINKS[args.target],
+        'sink_path': args.sink_path,
+        'compress': args.compress,
+        'key_values': profile == 'keyValues',
+        'profile': profile,
+        'encode': simulator.encode,
+        'write_behind': False,
+        'writers': concurrency,
+        'seed': seed
+    }, flight_count)
+
+    entities = (entity.to_ngsi() for group in (simulator.runways, simulator.weather_conditions)
+                for entity in group.values())
+    bootstrap(entities, target_sink.batch, batch_size, concurrency)
+    simulator.sink = target_sink
+
+# Run `ticks` ticks of one engine, sending each tick's changes in batches over
+# `concurrency` writer threads, and summarize the timings
+def run_engine(tick, ticks, sink, batch_size, concurrency):
+    sink.latencies = []
+    tick_times = []
+    updates = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        for _ in range(ticks):
+            tick_started = time.perf_counter()
+            for action_type, entities in tick().items():
+                batches = [entities[i:i + batch_size] for i in range(0, len(entities), batch_size)]
+                list(executor.map(lambda batch: sink.batch(batch, action_type, batch_size), batches))
+                updates += len(entities)
+            tick_times.append(time.perf_counter() - tick_started)
+        elapsed = time.perf_counter() - started
+
+    return {
+        'ticks': ticks,
+        'updates': updates,
+        'seconds': round(elapsed, 6),
+        'ticksPerSecond': round(ticks / elapsed, 1) if elapsed > 0 else 0.0,
+        'updatesPerSecond': round(updates / elapsed, 1) if elapsed > 0 else 0.0,
+        'tickMs': {
+            'p50': round(percentile(tick_times, 50) * 1000, 3),
+            'p95': round(percentile(tick_times, 95) * 1000, 3),
+            'p99': round(percentile(tick_times, 99) * 1000, 3),
+            'max': round(max(tick_times) * 1000, 3)
+        },
+        'requests': len(sink.latencies),
+        'requestLatencyMs': {
+            'p50': round(percentile(sink.latencies, 50) * 1000, 3),
+            'p95': round(percentile(sink.latencies, 95) * 1000, 3),
+            'p99': round(percentile(sink.latencies, 99) * 1000, 3)
+        },
+        'requestLatencyHistogram': histogram(sink.latencies)
+    }
+
+# Build the sink for one benchmark target
+def make_sink(args, client, profile):
+    if args.target == 'ndjson':
+        return create_sink('ndjson', args.sink_path, args.compress)
+    if args.target in ('stub', 'orion'):
+        return create_sink('orion', client=client, key_values=profile == 'keyValues')
+    return NullSink()
+
+# Benchmark one combination of payload profile, fleet size, batch size,
+# concurrency and shard count. With the stand-in, the request bytes each
+# engine sent are reported as well. With shards, the workers write the
+# flight changes themselves, so the flight engine's updates and requests are
+# only the separation alerts; compare its ticks per second instead.
+def run_combination(args, client, stub, profile, flight_count, batch_size, concurrency, shard_count):
+    sharded = shard_count > 1
+    set_profile(profile)
+    if client is not None:
+        client.set_pool_size(concurrency)
+    sink = TimedSink(make_sink(args, client, profile))
+    started = time.perf_counter()
+    if sharded:
+        setup_sharded_world(args, client, profile, flight_count, shard_count, sink, batch_size, concurrency,
+                            args.seed)
+    else:
+        setup_world(flight_count, sink, batch_size, concurrency, args.seed)
+    setup_seconds = time.perf_counter() - started
+
+    results = {}
+    for name, tick in zip(('flight', 'weather', 'runway'), simulator.select_ticks()):
+        bytes_before = stub.state.stats()['bytesIn'] if stub is not None else 0
+        results[name] = run_engine(tick, args.ticks, sink, batch_size, concurrency)
+        if stub is not None:
+            results[name]['requestBytes'] = stub.state.stats()['bytesIn'] - bytes_before
+
+    if sharded:
+        simulator.shards.close()
+    sink.close()
+    return {
+        'payloadProfile': profile,
+        'flights': flight_count,
+        'batchSize': batch_size,
+        'concurrency': concurrency,
+        'shards': shard_count,
+        'setupSeconds': round(setup_seconds, 3),
+        'engines': results,
+        'peakRssMb': round(peak_rss_mb(), 1)
+    }
+
+# The stand-in and client for a benchmark target
+def connect(args):
+    if args.target == 'stub':
+        stub = OrionStub(port=0, latency=args.stub_latency).start()
+        return stub, OrionClient(stub.url)
+    if args.target == 'orion':
+        return None, OrionClient(args.orion_url)
+    return None, None
+
+# Process benchmarking one combination, with the simulator's per-entity
+# progress output silenced. Its standard output is pointed at os.devnull
+# itself, so the shard workers it starts inherit the silence. It has its own
+# simulator world, connection pool and stand-in, so the peak RSS, alerts and
+# stored entities of one combination never carry over to the next. Answers
+# (error, result, stand-in statistics).
+def run_combination_process(args, combination, connection):
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), sys.stdout.fileno())
+    stub, client = connect(args)
+    try:
+        result = run_combination(args, client, stub, *combination)
+        connection.send((None, result, stub.state.stats() if stub is not None else None))
+    except Exception as e:
+        connection.send((f"{type(e).__name__}: {e}", None, None))
+    finally:
+        if stub is not None:
+            stub.stop()
+
+# Add one combination's stand-in statistics to the running totals
+def add_stats(totals, stats):
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            counts = totals.setdefault(name, {})
+            for key, count in value.items():
+                counts[key] = counts.get(key, 0) + count
+        else:
+            totals[name] = totals.get(name, 0) + value
+
+# Benchmark every combination of payload profile, fleet size, batch size,
+# concurrency and shard count, each in a fresh spawned process, adding the
+# stand-in's statistics to stub_stats
+def run_benchmarks(args, stub_stats):
+    combinations = [(profile, flight_count, batch_size, concurrency, shard_count)
+                    for profile in args.payload_profiles
+                    for flight_count in args.flights
+                    for batch_size in args.batch_sizes
+                    for concurrency in args.concurrency
+                    for shard_count in args.shards]
+
+    context = multiprocessing.get_context('spawn')
+    for combination in combinations:
+        connection, child = context.Pipe()
+        process = context.Process(target=run_combination_process, args=(args, combination, child))
+        process.start()
+        child.close()
+        try:
+            error, result, stats = connection.recv()
+        except EOFError:
+            error = 'benchmark process exited without a result'
+        process.join()
+        if error is not None:
+            raise RuntimeError(f"Benchmark {combination} failed: {error}")
+        if stats is not None:
+            add_stats(stub_stats, stats)
+        yield result
+
+# Parse a comma-separated list of positive integers
+def int_list(value):
+    items = [int(item) for item in value.split(',') if item]
+    for item in items:
+        if item < 1:
+            raise argparse.ArgumentTypeError(f"must be at least 1: {item}")
+    return items
+
+# Parse a comma-separated list of payload profiles
+def profile_list(value):
+    profiles = [item for item in value.split(',') if item]
+    for profile in profiles:
+        if profile not in PROFILES:
+            raise argparse.ArgumentTypeError(f"unknown payload profile: {profile}")
+    return profiles
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Airport Digital Twin simulator write path')
+    parser.add_argument('--target', choices=TARGETS, default='null',
+                        help='Write to the null sink, an NDJSON file, an in-process Orion stand-in or a real Orion')
+    parser.add_argument('--flights', type=int_list, default=[20, 1000, 10000, 100000],
+                        help='Comma-separated fleet sizes to sweep')
+    parser.add_argument('--batch-sizes', type=int_list, default=[100],
+                        help='Comma-separated /v2/op/update batch sizes to sweep')
+    parser.add_argument('--concurrency', type=int_list, default=[1],
+                        help='Comma-separated numbers of concurrent writers to sweep')
+    parser.add_argument('--shards', type=int_list, default=[1],
+                        help='Comma-separated numbers of worker processes to split the flights across')
+    parser.add_argument('--payload-profiles', type=profile_list, default=['normalized'],
+                        help=f"Comma-separated payload profiles to sweep ({', '.join(PROFILES)})")
+    parser.add_argument('--ticks', type=int, default=20, help='Ticks to run per engine')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated world')
+    parser.add_argument('--orion-url', default=simulator.ORION_URL, help='Orion URL for the orion target')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='Latency injected by the stand-in, in seconds')
+    parser.add_argument('--sink-path', default=os.devnull, help='Output file for the ndjson target')
+    parser.add_argument('--compress', action='store_true', help='Gzip-compress the ndjson target output')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+
+    args = parser.parse_args()
+    if args.ticks < 1:
+        parser.error('--ticks must be at least 1')
+
+    report = {
+        'target': args.target,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': []
+    }
+
+    stub_stats = {}
+    try:
+        for result in run_benchmarks(args, stub_stats):
+            report['results'].append(result)
+            flight = result['engines']['flight']
+            print(f"profile={result['payloadProfile']} flights={result['flights']} batch={result['batchSize']} concurrency={result['concurrency']} "
+                  f"shards={result['shards']}: {flight['ticksPerSecond']:.1f} flight ticks/s, "
+                  f"{flight['updatesPerSecond']:.0f} flight updates/s, "
+                  f"tick p50={flight['tickMs']['p50']}ms p99={flight['tickMs']['p99']}ms, "
+                  f"rss={result['peakRssMb']}MB", file=sys.stderr)
+    finally:
+        if args.target == 'stub':
+            report['stub'] = stub_stats
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
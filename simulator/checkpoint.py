@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import os
+import json
+import struct
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from metrics import ERRORS
+
+# Checkpoint file used by --checkpoint/--resume, and how often it is written
+# in simulated seconds
+CHECKPOINT_PATH = os.getenv('SIM_CHECKPOINT', '')
+CHECKPOINT_INTERVAL = float(os.getenv('SIM_CHECKPOINT_INTERVAL', '300'))
+
+# File layout: MAGIC, the header length as a little-endian uint64, a JSON
+# header, then the raw arrays, each starting on an ALIGNMENT-byte boundary so
+# they can be memory-mapped in place. The header lists every array's dtype,
+# shape and offset next to whatever small state the caller stores in it.
+MAGIC = b'ATCCKPT1'
+ALIGNMENT = 64
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+# Write a checkpoint atomically: the file is written and synced under a
+# temporary name, then renamed over the previous checkpoint
+def write_checkpoint(path, header, arrays):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    header_bytes = json.dumps({'header': header, 'arrays': layout}, separators=(',', ':')).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# Read a checkpoint, returning its header and read-only arrays memory-mapped
+# from the file
+def read_checkpoint(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a simulator checkpoint")
+        (header_length,) = struct.unpack('<Q', f.read(8))
+        contents = json.loads(f.read(header_length))
+
+    data_start = _aligned(len(MAGIC) + 8 + header_length)
+    arrays = {}
+    for name, spec in contents['arrays'].items():
+        shape = tuple(spec['shape'])
+        if not np.prod(shape):
+            arrays[name] = np.empty(shape, dtype=spec['dtype'])
+            continue
+        arrays[name] = np.memmap(path, dtype=spec['dtype'], mode='r', offset=data_start + spec['offset'], shape=shape)
+    return contents['header'], arrays
+
+# Writes checkpoints on a background thread so the simulation never waits on
+# the disk. A snapshot taken while the previous one is still being written is
+# dropped rather than queued.
+class Checkpointer:
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        self.pending = None
+        self.count = 0
+        self.skipped = 0
+
+    def _write(self, header, arrays):
+        try:
+            write_checkpoint(self.path, header, arrays)
+            self.count += 1
+        except Exception as e:
+            ERRORS.inc('checkpoint')
+            print(f"Error writing checkpoint {self.path}: {e}")
+
+    # Write a snapshot in the background; returns False if a write is still running
+    def save(self, header, arrays):
+        if self.pending is not None and not self.pending.done():
+            self.skipped += 1
+            return False
+        self.pending = self.executor.submit(self._write, header, arrays)
+        return True
+
+    # Write a final snapshot and wait for it
+    def close(self, header=None, arrays=None):
+        if self.pending is not None:
+            self.pending.result()
+        if header is not None:
+            self._write(header, arrays)
+        self.executor.shutdown()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import os
+import time
+import random
+import threading
+from metrics import CIRCUIT_STATE
+
+# Consecutive failed requests that open the circuit, and the range of the
+# exponential backoff before a probe request is let through, in seconds
+FAILURE_THRESHOLD = int(os.getenv('ORION_BREAKER_THRESHOLD', '5'))
+BASE_DELAY = float(os.getenv('ORION_BREAKER_BASE_DELAY', '1'))
+MAX_DELAY = float(os.getenv('ORION_BREAKER_MAX_DELAY', '60'))
+
+CLOSED = 'closed'
+HALF_OPEN = 'half-open'
+OPEN = 'open'
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Raised instead of sending a request while the circuit is open
+class CircuitOpenError(Exception):
+    pass
+
+# Circuit breaker for one service. After `threshold` consecutive failures the
+# circuit opens and requests fail fast without touching the network. Once the
+# backoff delay has passed, a single probe request is let through (half-open):
+# success closes the circuit, failure opens it again with the delay doubled,
+# up to max_delay. Each delay is jittered between half and all of its value,
+# so clients that failed together do not all retry at the same moment.
+class CircuitBreaker:
+    def __init__(self, name, threshold=FAILURE_THRESHOLD, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.name = name
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.retry_at = 0.0
+        CIRCUIT_STATE.set(STATE_CODES[CLOSED], name)
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.set(STATE_CODES[state], self.name)
+
+    # Whether a request may go out now. Moves an open circuit whose backoff
+    # has passed to half-open, letting this one request through as the probe.
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.retry_at:
+                self._set_state(HALF_OPEN)
+                return True
+            return False
+
+    # Whether the circuit is closed or ready for a probe, without taking it
+    def ready(self):
+        with self.lock:
+            return self.state == CLOSED or (self.state == OPEN and time.monotonic() >= self.retry_at)
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                print(f"{self.name} is reachable again, closing circuit after {self.opens} backoffs")
+                self.opens = 0
+                self._set_state(CLOSED)
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self.opens += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** (self.opens - 1))
+                delay = random.uniform(delay / 2, delay)
+                self.retry_at = time.monotonic() + delay
+                self._set_state(OPEN)
+                print(f"{self.name} failed {self.failures} times in a row, opening circuit for {delay:.1f}s")
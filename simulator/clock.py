@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import os
+import math
+import time
+import datetime
+from metrics import TICK_OVERRUNS
+
+# How many times faster than wall-clock time the simulation runs
+SPEEDUP = float(os.getenv('SIM_SPEEDUP', '1'))
+
+# Naive datetime for an ISO timestamp. Orion returns DateTime values with a
+# trailing "Z", which datetime.fromisoformat() only accepts from Python 3.11.
+# The simulator keeps naive times and Orion stores them as written, so the
+# UTC offset is dropped again to read back the time that was sent.
+def parse_timestamp(timestamp):
+    if timestamp.endswith('Z'):
+        timestamp = timestamp[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(timestamp).replace(tzinfo=None)
+
+# Simulated time, starting at the wall-clock time the clock was created and
+# advancing `speedup` times faster than real time
+class SimulationClock:
+    def __init__(self, speedup=SPEEDUP, start=None):
+        self.speedup = speedup
+        self.start_monotonic = time.monotonic()
+        self.start_time = start or datetime.datetime.now()
+        self.tickers = []
+
+    # Simulated seconds since the clock started
+    def elapsed(self):
+        return (time.monotonic() - self.start_monotonic) * self.speedup
+
+    # Current simulated time
+    def now(self):
+        return self.start_time + datetime.timedelta(seconds=self.elapsed())
+
+    # Current simulated time in ISO format
+    def timestamp(self):
+        return self.now().isoformat()
+
+    # Fixed-rate ticker firing every `interval` simulated seconds
+    def ticker(self, interval, name):
+        ticker = Ticker(self, interval, name)
+        self.tickers.append(ticker)
+        return ticker
+
+    # Print tick and overrun counts for every ticker
+    def report(self):
+        for ticker in self.tickers:
+            print(f"{ticker.name}: {ticker.ticks} ticks, {ticker.overruns} overruns, "
+                  f"max overrun {ticker.max_overrun:.3f}s")
+
+# Fixed-rate ticks measured from absolute deadlines, so the time spent doing
+# the work of a tick does not push later ticks back. When the work takes
+# longer than the period the tick is counted as an overrun and the next one
+# starts immediately; ticks missed by more than a whole period are dropped
+# rather than run back to back.
+class Ticker:
+    def __init__(self, clock, interval, name):
+        self.name = name
+        self.interval = interval
+        self.period = interval / clock.speedup
+        self.deadline = time.monotonic()
+        self.ticks = 0
+        self.overruns = 0
+        self.max_overrun = 0.0
+
+    # Wall-clock seconds to wait before the next tick
+    def delay(self):
+        self.ticks += 1
+        self.deadline += self.period
+        now = time.monotonic()
+        delay = self.deadline - now
+        if delay >= 0:
+            return delay
+
+        overrun = -delay
+        self.overruns += 1
+        TICK_OVERRUNS.inc(self.name)
+        self.max_overrun = max(self.max_overrun, overrun)
+        print(f"{self.name} tick overran its {self.period:.3f}s period by {overrun:.3f}s")
+        if overrun > self.period:
+            self.deadline += math.floor(overrun / self.period) * self.period
+        return 0.0
+
+    # Block until the next tick
+    def sleep(self):
+        time.sleep(self.delay())
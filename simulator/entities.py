@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+import os
+from serializer import encode_entity
+
+# Payload profiles for entity writes:
+#   normalized - typed attributes, each with unit and timestamp metadata (default)
+#   compact    - typed attributes without metadata, plus one TimeInstant per entity
+#   keyValues  - bare attribute values plus TimeInstant, sent with options=keyValues
+PROFILES = ['normalized', 'compact', 'keyValues']
+PAYLOAD_PROFILE = os.getenv('SIM_PAYLOAD_PROFILE', 'normalized')
+
+# Compact in-memory entities. Each attribute is a plain Python value held in
+# a slot, with one timestamp per attribute and a bitmask of the attributes
+# changed since the last update. NGSI-v2 dicts are only built on the wire.
+class Entity:
+    __slots__ = ('id', 'timestamps', 'dirty')
+
+    # Payload profile used by to_ngsi(), shared by all entity types
+    profile = PAYLOAD_PROFILE
+
+    # NGSI entity type
+    TYPE = None
+    # Attribute name -> (NGSI type, unit, whether it carries a timestamp)
+    ATTRIBUTES = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.NAMES = tuple(cls.ATTRIBUTES)
+        cls.INDEX = {name: i for i, name in enumerate(cls.NAMES)}
+
+    def __init__(self, id, timestamp=None, **values):
+        self.id = id
+        self.timestamps = [timestamp] * len(self.NAMES)
+        self.dirty = 0
+        for name in self.NAMES:
+            setattr(self, name, values.get(name))
+
+    # Set an attribute value, refresh its timestamp and mark it as changed.
+    # Writing the value an attribute already holds is a no-op.
+    def set(self, name, value, timestamp):
+        if getattr(self, name) == value:
+            return
+        setattr(self, name, value)
+        i = self.INDEX[name]
+        self.timestamps[i] = timestamp
+        self.dirty |= 1 << i
+
+    # Names of the attributes changed since the last update
+    def changed(self):
+        return [name for i, name in enumerate(self.NAMES) if self.dirty >> i & 1]
+
+    # NGSI-v2 form of one attribute
+    def attribute(self, name):
+        attribute_type, unit, timestamped = self.ATTRIBUTES[name]
+        value = getattr(self, name)
+        if isinstance(value, tuple):
+            value = {'type': 'Point', 'coordinates': list(value)}
+
+        attribute = {'type': attribute_type, 'value': value}
+        if unit is not None or timestamped:
+            metadata = attribute['metadata'] = {}
+            if unit is not None:
+                metadata['unit'] = {'type': 'Text', 'value': unit}
+            if timestamped:
+                metadata['timestamp'] = {'type': 'DateTime', 'value': self.timestamps[self.INDEX[name]]}
+        return attribute
+
+    # NGSI-v2 entity with all attributes, or only the given ones, in the
+    # given payload profile (by default the one set with set_profile())
+    def to_ngsi(self, names=None, profile=None):
+        profile = profile or self.profile
+        names = names or self.NAMES
+        entity = {'id': self.id, 'type': self.TYPE}
+        if profile == 'normalized':
+            for name in names:
+                entity[name] = self.attribute(name)
+            return entity
+
+        # Compact profiles carry the attribute values only, with the latest
+        # timestamp of the timestamped ones as a single TimeInstant
+        key_values = profile == 'keyValues'
+        latest = None
+        for name in names:
+            value = getattr(self, name)
+            if isinstance(value, tuple):
+                value = {'type': 'Point', 'coordinates': list(value)}
+            attribute_type, unit, timestamped = self.ATTRIBUTES[name]
+            entity[name] = value if key_values else {'type': attribute_type, 'value': value}
+            if timestamped:
+                timestamp = self.timestamps[self.INDEX[name]]
+                if timestamp is not None and (latest is None or timestamp > latest):
+                    latest = timestamp
+
+        if latest is not None:
+            entity['TimeInstant'] = latest if key_values else {'type': 'DateTime', 'value': latest}
+        return entity
+
+    # NGSI-v2 JSON bytes of the same document to_ngsi() builds, rendered
+    # from a precompiled template
+    def to_json(self, names=None, profile=None):
+        return encode_entity(self, names, profile or self.profile)
+
+    # Take the attributes changed since the last call as a partial NGSI
+    # entity, or None. encode=True returns it as JSON bytes instead of a dict.
+    def pop_changes(self, encode=False):
+        if not self.dirty:
+            return None
+        names = self.changed()
+        changes = self.to_json(names) if encode else self.to_ngsi(names)
+        self.dirty = 0
+        return changes
+
+    # Build an entity from an NGSI-v2 dict
+    @classmethod
+    def from_ngsi(cls, data):
+        values = {}
+        timestamps = []
+        for name in cls.NAMES:
+            attribute = data.get(name) or {}
+            value = attribute.get('value')
+            if isinstance(value, dict) and value.get('type') == 'Point':
+                value = tuple(value['coordinates'])
+            values[name] = value
+            timestamp = attribute.get('metadata', {}).get('timestamp', {}).get('value')
+            timestamps.append(timestamp)
+
+        entity = cls(data['id'], **values)
+        entity.timestamps = timestamps
+        return entity
+
+    # Build an entity from its keyValues form, which carries no metadata, so
+    # every attribute gets the given timestamp
+    @classmethod
+    def from_key_values(cls, data, timestamp=None):
+        values = {}
+        for name in cls.NAMES:
+            value = data.get(name)
+            if isinstance(value, dict) and value.get('type') == 'Point':
+                value = tuple(value['coordinates'])
+            values[name] = value
+        return cls(data['id'], timestamp, **values)
+
+# Select the payload profile for every entity write
+def set_profile(profile):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown payload profile: {profile}. Available profiles: {', '.join(PROFILES)}")
+    Entity.profile = profile
+
+class Flight(Entity):
+    TYPE = 'Flight'
+    ATTRIBUTES = {
+        'callSign': ('Text', None, False),
+        'aircraftType': ('Text', None, False),
+        'origin': ('Text', None, False),
+        'destination': ('Text', None, False),
+        'status': ('Text', None, True),
+        'position': ('geo:json', None, True),
+        'altitude': ('Number', 'feet', True),
+        'speed': ('Number', 'knots', True),
+        'heading': ('Number', 'degrees', True),
+        'scheduledArrival': ('DateTime', None, False),
+        'estimatedArrival': ('DateTime', None, False),
+        'assignedRunway': ('Text', None, False)
+    }
+    __slots__ = tuple(ATTRIBUTES)
+
+class RunwayStatus(Entity):
+    TYPE = 'RunwayStatus'
+    ATTRIBUTES = {
+        'runwayId': ('Text', None, False),
+        'airport': ('Text', None, False),
+        'name': ('Text', None, False),
+        'length': ('Number', 'meters', False),
+        'status': ('Text', None, True),
+        'operation': ('Text', None, True),
+        'visibility': ('Number', 'kilometers', True),
+        'surfaceCondition': ('Text', None, True),
+        'nextScheduledMaintenance': ('DateTime', None, False),
+        'currentCapacity': ('Number', 'percent', True),
+        'location': ('geo:json', None, False),
+        'arrivalSequence': ('StructuredValue', None, True),
+        'departureSequence': ('StructuredValue', None, True),
+        'arrivalQueueLength': ('Number', None, True),
+        'departureQueueLength': ('Number', None, True),
+        'arrivalSeparation': ('Number', 'seconds', True),
+        'departureSeparation': ('Number', 'seconds', True)
+    }
+    __slots__ = tuple(ATTRIBUTES)
+
+class WeatherCondition(Entity):
+    TYPE = 'WeatherCondition'
+    ATTRIBUTES = {
+        'location': ('geo:json', None, False),
+        'airport': ('Text', None, False),
+        'temperature': ('Number', 'celsius', True),
+        'windSpeed': ('Number', 'knots', True),
+        'windDirection': ('Number', 'degrees', True),
+        'visibility': ('Number', 'kilometers', True),
+        'precipitation': ('Number', 'mm/h', True),
+        'cloudCoverage': ('Number', 'percent', True),
+        'weatherAlert': ('Boolean', None, True),
+        'condition': ('Text', None, True)
+    }
+    __slots__ = tuple(ATTRIBUTES)
+
+class SeparationAlert(Entity):
+    TYPE = 'SeparationAlert'
+    ATTRIBUTES = {
+        'flights': ('StructuredValue', None, False),
+        'status': ('Text', None, True),
+        'horizontalDistance': ('Number', 'nautical miles', True),
+        'verticalDistance': ('Number', 'feet', True),
+        'location': ('geo:json', None, True)
+    }
+    __slots__ = tuple(ATTRIBUTES)
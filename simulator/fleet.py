@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import numpy as np
+
+# Flight status codes stored in the fleet status array
+STATUSES = ['scheduled', 'boarding', 'taxiing', 'airborne', 'landing', 'landed']
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+AIRBORNE = STATUS_CODES['airborne']
+LANDING = STATUS_CODES['landing']
+
+# Random perturbations applied to airborne flights each tick
+ALTITUDE_CHANGE_PROBABILITY = 0.3
+ALTITUDE_STEPS = np.array([-1000, -500, 0, 500, 1000])
+SPEED_CHANGE_PROBABILITY = 0.2
+SPEED_STEPS = np.array([-50, -25, 0, 25, 50])
+LANDING_PROBABILITY = 0.1
+LANDING_ALTITUDE = 10000
+
+# Flights turn STORM_TURN degrees towards the drier side when the
+# precipitation STORM_LOOKAHEAD ticks ahead of them exceeds STORM_PRECIPITATION
+# mm/h, and never fly slower than MIN_GROUNDSPEED knots into a headwind
+STORM_PRECIPITATION = 5
+STORM_LOOKAHEAD = 6
+STORM_TURN = 15
+MIN_GROUNDSPEED = 100
+
+# Degrees flown per knot of groundspeed in one tick
+DEGREES_PER_KNOT = 0.0001
+
+# Flight attributes owned by the engine
+FLIGHT_ATTRIBUTES = ('position', 'altitude', 'speed', 'heading', 'status')
+
+# Kinematic state of the whole fleet, one array row per flight, advanced with
+# one vectorized step per tick. Flights bound for one of the simulated
+# `airports` may start landing. Given a weather.WeatherGrid, flights fly at
+# the groundspeed the wind at their position gives them and steer around
+# storms ahead. NGSI payloads are only built for the rows that changed when
+# the fleet is emitted.
+class FleetEngine:
+    def __init__(self, flights, airports=('JFK',), seed=None):
+        self.flights = list(flights)
+        self.ids = [flight.id for flight in self.flights]
+        self.index = {flight_id: row for row, flight_id in enumerate(self.ids)}
+        self.rng = np.random.default_rng(seed)
+
+        self.lat = np.array([flight.position[0] for flight in self.flights], dtype=np.float64)
+        self.lng = np.array([flight.position[1] for flight in self.flights], dtype=np.float64)
+        self.heading = np.array([flight.heading for flight in self.flights], dtype=np.float64)
+        self.speed = np.array([flight.speed for flight in self.flights], dtype=np.int64)
+        self.altitude = np.array([flight.altitude for flight in self.flights], dtype=np.int64)
+        self.status = np.array([STATUS_CODES[flight.status] for flight in self.flights], dtype=np.int8)
+        self.arriving = np.array([flight.destination in airports for flight in self.flights], dtype=bool)
+
+        self.dirty = {name: np.zeros(len(self.ids), dtype=bool) for name in FLIGHT_ATTRIBUTES}
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Turn the airborne flights heading into a storm and return the
+    # groundspeed of every flight, sampling the weather grid at the airborne
+    # flights' positions only
+    def _fly_weather(self, weather, airborne):
+        groundspeed = self.speed.astype(np.float64)
+        rows = np.flatnonzero(airborne)
+        if not len(rows):
+            return groundspeed
+        lat, lng, speed = self.lat[rows], self.lng[rows], groundspeed[rows]
+        heading = np.radians(self.heading[rows])
+
+        # Compare the precipitation ahead of the flights, then left and
+        # right of those heading into a storm
+        reach = speed * DEGREES_PER_KNOT * STORM_LOOKAHEAD
+        def precipitation_ahead(angle, subset=slice(None)):
+            return weather.sample(lat[subset] + np.sin(angle) * reach[subset],
+                                  lng[subset] + np.cos(angle) * reach[subset], ('precipitation',))['precipitation']
+
+        stormy = np.flatnonzero(precipitation_ahead(heading) > STORM_PRECIPITATION)
+        if len(stormy):
+            turn = np.radians(STORM_TURN)
+            left = precipitation_ahead(heading[stormy] + turn, stormy)
+            right = precipitation_ahead(heading[stormy] - turn, stormy)
+            turned = rows[stormy]
+            self.heading[turned] = (self.heading[turned] + np.where(left <= right, STORM_TURN, -STORM_TURN)) % 360
+            self.dirty['heading'][turned] = True
+            heading[stormy] = np.radians(self.heading[turned])
+
+        # Add the wind component along the heading
+        wind = weather.sample(lat, lng, ('windU', 'windV'))
+        tailwind = wind['windU'] * np.cos(heading) + wind['windV'] * np.sin(heading)
+        groundspeed[rows] = np.maximum(speed + tailwind, MIN_GROUNDSPEED)
+        return groundspeed
+
+    # Advance every airborne flight by one tick, in the given weather grid if any
+    def step(self, weather=None):
+        n = len(self.ids)
+        rng = self.rng
+        airborne = self.status == AIRBORNE
+
+        # Move along the current heading
+        speed = self.speed if weather is None else self._fly_weather(weather, airborne)
+        distance = np.where(airborne, speed * DEGREES_PER_KNOT, 0.0)
+        heading = np.radians(self.heading)
+        self.lat += np.sin(heading) * distance
+        self.lng += np.cos(heading) * distance
+        self.dirty['position'] |= airborne
+
+        # Occasionally change altitude
+        new_altitude = np.clip(self.altitude + rng.choice(ALTITUDE_STEPS, n), 5000, 40000)
+        changed = airborne & (rng.random(n) < ALTITUDE_CHANGE_PROBABILITY) & (new_altitude != self.altitude)
+        self.altitude = np.where(changed, new_altitude, self.altitude)
+        self.dirty['altitude'] |= changed
+
+        # Occasionally change speed
+        new_speed = np.clip(self.speed + rng.choice(SPEED_STEPS, n), 300, 600)
+        changed = airborne & (rng.random(n) < SPEED_CHANGE_PROBABILITY) & (new_speed != self.speed)
+        self.speed = np.where(changed, new_speed, self.speed)
+        self.dirty['speed'] |= changed
+
+        # Occasionally start landing for low arrivals
+        landing = airborne & self.arriving & (rng.random(n) < LANDING_PROBABILITY) & (self.altitude < LANDING_ALTITUDE)
+        self.status[landing] = LANDING
+        self.dirty['status'] |= landing
+
+    # Plain Python values for the given rows of one attribute
+    def _values(self, name, rows):
+        if name == 'position':
+            return list(zip(self.lat[rows].tolist(), self.lng[rows].tolist()))
+        if name == 'status':
+            return [STATUSES[code] for code in self.status[rows].tolist()]
+        return getattr(self, name)[rows].tolist()
+
+    # Write the rows changed since the last call back into their Flight
+    # entities and take those flights' changes as partial NGSI entities
+    # (JSON bytes with encode=True)
+    def emit(self, timestamp, encode=False):
+        changed = set()
+
+        for name, dirty in self.dirty.items():
+            rows = np.flatnonzero(dirty)
+            if not len(rows):
+                continue
+
+            for row, value in zip(rows.tolist(), self._values(name, rows)):
+                self.flights[row].set(name, value, timestamp)
+            changed.update(rows.tolist())
+            dirty[:] = False
+
+        changes = (self.flights[row].pop_changes(encode) for row in sorted(changed))
+        return [entity for entity in changes if entity]
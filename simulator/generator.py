@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+import os
+import math
+import random
+import argparse
+import datetime
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from entities import Flight
+from airports import load_catalog, select_airports
+from orion_client import BATCH_SIZE, POOL_SIZE
+from metrics import ERRORS
+
+# Number of flights generated at startup
+FLIGHT_COUNT = int(os.getenv('SIM_FLIGHTS', '20'))
+
+# Default traffic tables
+AIRLINES = ['UA', 'BA', 'DL', 'AA', 'LH', 'AF', 'EK']
+ORIGINS = ['JFK', 'LAX', 'LHR', 'CDG', 'DXB', 'SFO', 'ORD']
+DESTINATIONS = ['ATL', 'DFW', 'FRA', 'SYD', 'HND', 'AMS', 'MAD']
+AIRCRAFT_TYPES = ['Boeing 737-800', 'Airbus A320', 'Boeing 777-300ER', 'Airbus A350-900', 'Boeing 787-9']
+
+# Scheduled arrivals spread uniformly over this many hours from now
+ARRIVAL_WINDOW = float(os.getenv('SIM_ARRIVAL_WINDOW', '6'))
+
+# Airline mix such as "UA:3,BA:1,DL", or empty for an even mix of AIRLINES
+AIRLINE_MIX = os.getenv('SIM_AIRLINE_MIX', '')
+
+# Range of minutes an estimated arrival runs early (negative) or late
+DELAY_MINUTES = (-10, 30)
+
+# Parse an airline mix such as "UA:3,BA:1,DL" into airlines and weights, as
+# an argparse type. An empty mix is an even mix of AIRLINES.
+def parse_mix(value):
+    airlines, weights = [], []
+    for item in value.split(','):
+        if not item:
+            continue
+        airline, _, weight = item.partition(':')
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight for {airline.strip()}: {weight}")
+        if not airline.strip() or not 0 <= weight < math.inf:
+            raise argparse.ArgumentTypeError(f"invalid airline mix entry: {item}")
+        airlines.append(airline.strip())
+        weights.append(weight)
+    if not airlines:
+        return AIRLINES, None
+    if not sum(weights) > 0:
+        raise argparse.ArgumentTypeError(f"airline mix has no positive weight: {value}")
+    return airlines, weights
+
+# Lazily generates random Flight entities for the simulated airports, given
+# as {code: Airport}. With one airport, half the flights arrive at it from
+# `origins` and half depart from it to `destinations`. With several, every
+# flight is routed between two of them, and airborne flights are placed along
+# their route, heading for their destination. Call signs are unique across
+# the generated fleet.
+class FleetGenerator:
+    def __init__(self, count=FLIGHT_COUNT, airlines=AIRLINES, airline_weights=None, origins=ORIGINS,
+                 destinations=DESTINATIONS, aircraft_types=AIRCRAFT_TYPES, airports=None,
+                 arrival_window=ARRIVAL_WINDOW, delay_minutes=DELAY_MINUTES, start=None, seed=None):
+        self.count = count
+        self.airlines = airlines
+        self.airline_weights = airline_weights
+        self.airports = list((airports or select_airports(load_catalog())).values())
+        self.home_airport = self.airports[0]
+        self.origins = [origin for origin in origins if origin != self.home_airport.code] or origins
+        self.destinations = destinations
+        self.aircraft_types = aircraft_types
+        self.arrival_window = arrival_window
+        self.delay_minutes = delay_minutes
+        self.start = start or datetime.datetime.now()
+        self.rng = random.Random(seed) if seed is not None else random
+
+    def __len__(self):
+        return self.count
+
+    # Unique call sign, widening the flight number range for large fleets
+    def _callsigns(self):
+        rng = self.rng
+        callsigns = set()
+        max_flight_num = max(999, self.count * 10)
+        for airline in rng.choices(self.airlines, self.airline_weights, k=self.count):
+            callsign = f"{airline}{rng.randint(100, max_flight_num)}"
+            while callsign in callsigns:
+                callsign = f"{airline}{rng.randint(100, max_flight_num)}"
+            callsigns.add(callsign)
+            yield callsign
+
+    def __iter__(self):
+        rng = self.rng
+        timestamp = self.start.isoformat()
+
+        home = self.home_airport
+        for callsign in self._callsigns():
+            if len(self.airports) > 1:
+                # Fly between two of the simulated airports
+                origin_airport, destination_airport = rng.sample(self.airports, 2)
+                origin, destination = origin_airport.code, destination_airport.code
+                status = rng.choice(['scheduled', 'boarding', 'taxiing', 'airborne'])
+                ground = origin_airport.location
+            elif rng.random() < 0.5:
+                # Determine if flight is arriving or departing
+                status = rng.choice(['scheduled', 'airborne'])
+                origin = rng.choice(self.origins)
+                destination = home.code
+                ground = home.location
+            else:
+                status = rng.choice(['scheduled', 'boarding', 'taxiing', 'airborne'])
+                origin = home.code
+                destination = rng.choice(self.destinations)
+                ground = home.location
+
+            # Set position based on status
+            if status != 'airborne':
+                position = ground
+                altitude = speed = heading = 0
+            elif len(self.airports) > 1:
+                (from_lat, from_lng), (to_lat, to_lng) = ground, destination_airport.location
+                progress = rng.uniform(0.1, 0.9)
+                position = (from_lat + (to_lat - from_lat) * progress, from_lng + (to_lng - from_lng) * progress)
+                altitude = rng.randint(5000, 35000)
+                speed = rng.randint(300, 550)
+                # The fleet engine moves flights north by sin(heading) and east by cos(heading)
+                heading = round(math.degrees(math.atan2(to_lat - from_lat, to_lng - from_lng))) % 360
+            else:
+                position = (home.location[0] + rng.uniform(-10, 10), home.location[1] + rng.uniform(-10, 10))
+                altitude = rng.randint(5000, 35000)
+                speed = rng.randint(300, 550)
+                heading = rng.randint(0, 359)
+
+            # Set scheduled arrival time, and an estimate running early or late
+            scheduled_arrival = self.start + datetime.timedelta(minutes=rng.uniform(0, self.arrival_window * 60))
+            estimated_arrival = scheduled_arrival + datetime.timedelta(minutes=rng.randint(*self.delay_minutes))
+
+            yield Flight(
+                f"Flight:{callsign}", timestamp,
+                callSign=callsign,
+                aircraftType=rng.choice(self.aircraft_types),
+                origin=origin,
+                destination=destination,
+                status=status,
+                position=position,
+                altitude=altitude,
+                speed=speed,
+                heading=heading,
+                scheduledArrival=scheduled_arrival.isoformat(),
+                estimatedArrival=estimated_arrival.isoformat()
+            )
+
+# Split an iterable into lists of at most `size` items without materializing it
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Bulk-load NGSI entities with chunked /v2/op/update append batches sent by
+# `workers` threads in parallel. The input is consumed lazily, with at most
+# two batches per worker waiting to be sent. Returns the number of entities sent.
+def bootstrap(entities, send, batch_size=BATCH_SIZE, workers=POOL_SIZE):
+    slots = threading.BoundedSemaphore(workers * 2)
+    count = 0
+
+    def write(chunk):
+        try:
+            send(chunk, 'append', batch_size)
+        except Exception as e:
+            ERRORS.inc('bootstrap')
+            print(f"Error bootstrapping {len(chunk)} entities: {e}")
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunked(entities, batch_size):
+            slots.acquire()
+            executor.submit(write, chunk)
+            count += len(chunk)
+    return count
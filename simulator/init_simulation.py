@@ -1,22 +1,13 @@
 #!/usr/bin/env python3
-import requests
 import os
 from dotenv import load_dotenv
+from orion_client import get_client
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
 ORION_URL = os.getenv('ORION_URL', 'http://orion:1026')
-FIWARE_SERVICE = 'airport'
-FIWARE_SERVICE_PATH = '/'
-
-# Headers for API requests
-HEADERS = {
-    'Content-Type': 'application/json',
-    'fiware-service': FIWARE_SERVICE,
-    'fiware-servicepath': FIWARE_SERVICE_PATH
-}
 
 def create_fiware_service():
     print("Creating FIWARE service...")
@@ -34,11 +25,7 @@ def create_fiware_service():
         ]
     }
     
-    response = requests.post(
-        f"{iot_agent_url}/iot/services",
-        headers=HEADERS,
-        json=service_data
-    )
+    response = get_client(iot_agent_url).post("/iot/services", service_data)
     
     if response.status_code == 201:
         print("FIWARE service created successfully")
@@ -68,11 +55,7 @@ def create_subscription_to_quantumleap():
         "throttling": 1
     }
     
-    response = requests.post(
-        f"{ORION_URL}/v2/subscriptions",
-        headers=HEADERS,
-        json=subscription_data
-    )
+    response = get_client(ORION_URL).post("/v2/subscriptions", subscription_data)
     
     if response.status_code == 201:
         print("Subscription to QuantumLeap created successfully")
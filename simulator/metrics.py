@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+import os
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Address of the Prometheus metrics endpoint; port 0 disables it
+METRICS_HOST = os.getenv('SIM_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('SIM_METRICS_PORT', '9464'))
+
+# Default histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Escape a label value for the Prometheus text format
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+# Sum two samples of a series: numbers, or the per-bucket lists of a histogram
+def _add(value, other):
+    if value is None:
+        return list(other) if isinstance(other, list) else other
+    if isinstance(value, list):
+        return [a + b for a, b in zip(value, other)]
+    return value + other
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Base of all metrics: a name, help text and label names, with one series
+# per combination of label values. Label values are passed positionally in
+# the order of labelnames. Series collected in other processes, such as
+# shard workers, can be merged in and are added to this process's own.
+class Metric:
+    TYPE = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.series = {}
+        self.remote = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    # Combine series from this process and other processes
+    def _combine(self, value, other):
+        return _add(value, other)
+
+    # This process's series, by label values
+    def collect(self):
+        with self.lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self.series.items()}
+
+    # Keep the latest series collected from another process, replacing the
+    # ones merged before from the same source
+    def merge(self, source, series):
+        with self.lock:
+            self.remote[source] = series
+
+    # Series of this process combined with the merged ones
+    def combined(self, series=None):
+        series = self.collect() if series is None else series
+        with self.lock:
+            remote = list(self.remote.values())
+        for other in remote:
+            for key, value in other.items():
+                series[key] = self._combine(series.get(key), value)
+        return series
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self.combined().items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for name, key, value, *extra in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, *extra)} {_format_value(value)}")
+        return lines
+
+# Monotonically increasing count
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+# Value that goes up and down. With set_function() the value is read when
+# the metrics are scraped: the function returns a number, or for labelled
+# gauges a {label values: number} dict. Merged series are summed, or with
+# aggregate='max' the highest value is kept, for states and levels.
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, aggregate='sum'):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = None
+        self.aggregate = aggregate
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def _combine(self, value, other):
+        if self.aggregate == 'max' and value is not None:
+            return max(value, other)
+        return _add(value, other)
+
+    def collect(self):
+        if self.function is None:
+            return super().collect()
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return {self._key(labels if isinstance(labels, tuple) else (labels,)): value
+                for labels, value in values.items()}
+
+# Distribution of observations in cumulative buckets, with their sum and count
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                # Per-bucket counts, then the sum
+                series = self.series[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    # Observe the wall-clock duration of a block in seconds
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        samples = []
+        for key, values in self.combined().items():
+            count = 0
+            for bound, bucket_count in zip(self.buckets, values):
+                count += bucket_count
+                samples.append((f"{self.name}_bucket", key, count, f'le="{_format_value(bound)}"'))
+            samples.append((f"{self.name}_sum", key, values[-1]))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+# All metrics of the process, rendered together in the Prometheus text format
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    # Series of every metric by metric name, to be merged into another
+    # process's registry
+    def collect(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        return {metric.name: metric.collect() for metric in metrics}
+
+    # Merge the collect() output of another process, named by source
+    def merge(self, source, collected):
+        with self.lock:
+            metrics = {metric.name: metric for metric in self.metrics}
+        for name, series in collected.items():
+            if name in metrics:
+                metrics[name].merge(source, series)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# Error collecting {metric.name}: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Simulator metrics
+TICK_SECONDS = Histogram('sim_tick_duration_seconds', 'Time spent computing one engine tick', ['engine'])
+TICK_OVERRUNS = Counter('sim_tick_overruns_total', 'Ticks that took longer than their period', ['engine'])
+REQUEST_SECONDS = Histogram('sim_orion_request_duration_seconds', 'Orion request latency by status code',
+                            ['method', 'status'])
+ENTITY_WRITES = Counter('sim_entity_writes_total', 'Entity writes sent to the sink', ['sink', 'op'])
+BYTES_SENT = Counter('sim_sent_bytes_total', 'Payload bytes sent to the sink', ['sink'])
+COALESCED = Counter('sim_coalesced_updates_total', 'Entity updates merged into a pending write')
+QUEUE_DEPTH = Gauge('sim_queue_depth', 'Writes waiting to be sent or in flight', ['queue'])
+RUNWAY_QUEUE_LENGTH = Gauge('sim_runway_queue_length', 'Flights queued per runway', ['runway', 'kind'])
+CIRCUIT_STATE = Gauge('sim_circuit_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)', ['target'],
+                      aggregate='max')
+RESYNCED = Counter('sim_resynced_entities_total', 'Entities written in bulk resyncs after an outage')
+ERRORS = Counter('sim_errors_total', 'Errors by component', ['component'])
+ENTITIES = Gauge('sim_entities', 'Live entities by type', ['type'])
+FLIGHTS = Gauge('sim_flights', 'Flights by status', ['status'])
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# Serves the registry at /metrics from a background thread
+class MetricsServer:
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT, registry=REGISTRY):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
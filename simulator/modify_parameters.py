@@ -1,26 +1,21 @@
 #!/usr/bin/env python3
 import os
 import argparse
-import requests
 from dotenv import load_dotenv
+from orion_client import get_client
+from airports import load_catalog, AIRPORT_CATALOG
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
 ORION_URL = os.getenv('ORION_URL', 'http://orion:1026')
-FIWARE_SERVICE = 'airport'
-FIWARE_SERVICE_PATH = '/'
 
-# Headers for API requests
-HEADERS = {
-    'Content-Type': 'application/json',
-    'fiware-service': FIWARE_SERVICE,
-    'fiware-servicepath': FIWARE_SERVICE_PATH
-}
+# Shared pooled client
+client = get_client(ORION_URL)
 
-def modify_weather_condition(condition):
-    print(f"Changing weather condition to: {condition}")
+def modify_weather_condition(condition, weather_id):
+    print(f"Changing weather condition of {weather_id} to: {condition}")
     
     # Predefined condition mappings
     condition_mappings = {
@@ -86,19 +81,15 @@ def modify_weather_condition(condition):
     }
     
     # Update entity in Orion
-    response = requests.patch(
-        f"{ORION_URL}/v2/entities/WeatherCondition:Airport1/attrs",
-        headers=HEADERS,
-        json=update_data
-    )
+    response = client.patch(f"/v2/entities/{weather_id}/attrs", update_data)
     
     if response.status_code == 204:
         print(f"Weather condition updated successfully to {condition}")
     else:
         print(f"Failed to update weather condition: {response.status_code} {response.text}")
 
-def modify_wind_speed(speed):
-    print(f"Changing wind speed to: {speed} knots")
+def modify_wind_speed(speed, weather_id):
+    print(f"Changing wind speed of {weather_id} to: {speed} knots")
     
     # Prepare update payload
     update_data = {
@@ -109,11 +100,7 @@ def modify_wind_speed(speed):
     }
     
     # Update entity in Orion
-    response = requests.patch(
-        f"{ORION_URL}/v2/entities/WeatherCondition:Airport1/attrs",
-        headers=HEADERS,
-        json=update_data
-    )
+    response = client.patch(f"/v2/entities/{weather_id}/attrs", update_data)
     
     if response.status_code == 204:
         print(f"Wind speed updated successfully to {speed} knots")
@@ -147,11 +134,7 @@ def modify_runway_status(runway_id, status):
         }
     
     # Update entity in Orion
-    response = requests.patch(
-        f"{ORION_URL}/v2/entities/RunwayStatus:{runway_id}/attrs",
-        headers=HEADERS,
-        json=update_data
-    )
+    response = client.patch(f"/v2/entities/RunwayStatus:{runway_id}/attrs", update_data)
     
     if response.status_code == 204:
         print(f"Runway {runway_id} status updated successfully to {status}")
@@ -164,15 +147,26 @@ def main():
                       help='Set weather condition')
     parser.add_argument('--wind-speed', type=float, help='Set wind speed in knots')
     parser.add_argument('--runway-status', nargs=2, metavar=('RUNWAY_ID', 'STATUS'),
-                      help='Set runway status (e.g., RW27L active)')
+                      help='Set runway status (e.g., RW27L active, LGA-RW04 maintenance)')
+    parser.add_argument('--airport', default='JFK',
+                      help='Catalog airport whose weather is changed')
+    parser.add_argument('--airport-catalog', default=AIRPORT_CATALOG,
+                      help='JSON airport catalog to use instead of the built-in one')
     
     args = parser.parse_args()
     
+    # Weather entities are named in the airport catalog
+    if args.weather_condition or args.wind_speed is not None:
+        catalog = load_catalog(args.airport_catalog)
+        airport = catalog.get(args.airport.upper())
+        if airport is None:
+            parser.error(f"Unknown airport: {args.airport}. Available airports: {', '.join(catalog)}")
+    
     if args.weather_condition:
-        modify_weather_condition(args.weather_condition)
+        modify_weather_condition(args.weather_condition, airport.weather_id)
     
     if args.wind_speed is not None:
-        modify_wind_speed(args.wind_speed)
+        modify_wind_speed(args.wind_speed, airport.weather_id)
     
     if args.runway_status:
         runway_id, status = args.runway_status
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from serializer import dumps, encode_item
+from metrics import REQUEST_SECONDS
+from circuit import CircuitBreaker, CircuitOpenError
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+ORION_URL = os.getenv('ORION_URL', 'http://orion:1026')
+FIWARE_SERVICE = 'airport'
+FIWARE_SERVICE_PATH = '/'
+BATCH_SIZE = int(os.getenv('ORION_BATCH_SIZE', '100'))
+POOL_SIZE = int(os.getenv('ORION_POOL_SIZE', '4'))
+PAGE_SIZE = int(os.getenv('ORION_PAGE_SIZE', '1000'))
+CONNECT_TIMEOUT = float(os.getenv('ORION_CONNECT_TIMEOUT', '3'))
+READ_TIMEOUT = float(os.getenv('ORION_READ_TIMEOUT', '10'))
+
+# Headers for API requests
+HEADERS = {
+    'fiware-service': FIWARE_SERVICE,
+    'fiware-servicepath': FIWARE_SERVICE_PATH
+}
+
+# Header for requests with a JSON body
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# HTTP client for Orion (and the other FIWARE services) that keeps connections
+# alive between calls. The connection pool holds one connection per thread
+# (pool_size) and blocks instead of opening extra sockets when all are busy,
+# so it can be shared by every simulation thread. Requests go through a
+# circuit breaker: connection errors, timeouts and 5xx responses count as
+# failures, and while the circuit is open requests raise CircuitOpenError
+# without being sent.
+class OrionClient:
+    def __init__(self, base_url=ORION_URL, pool_size=POOL_SIZE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(self.base_url)
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.set_pool_size(pool_size)
+
+    # Replace the connection pool with one holding pool_size connections,
+    # closing the connections of the previous one
+    def set_pool_size(self, pool_size):
+        previous = self.session.adapters.get('http://')
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if previous is not None:
+            previous.close()
+
+    # Send a request, recording its latency by status code ("error" when no
+    # response came back)
+    def request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit to {self.base_url} is open")
+        kwargs.setdefault('timeout', self.timeout)
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            status = str(response.status_code)
+        except Exception:
+            self.breaker.failure()
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method, status)
+
+        if response.status_code >= 500:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return response
+
+    def get(self, path, params=None):
+        return self.request('GET', path, params=params)
+
+    # Payloads are dicts, encoded with the fastest JSON encoder available,
+    # or JSON bytes that are sent as they are
+    def post(self, path, payload, params=None):
+        return self.request('POST', path, data=encode_item(payload), headers=JSON_HEADERS, params=params)
+
+    def patch(self, path, payload, params=None):
+        return self.request('PATCH', path, data=encode_item(payload), headers=JSON_HEADERS, params=params)
+
+    # Send entities in chunked /v2/op/update requests, returning (chunk, response) pairs.
+    # Entities may be dicts or already-encoded JSON bytes.
+    def batch_update(self, entities, action_type='update', batch_size=None, params=None):
+        batch_size = batch_size or BATCH_SIZE
+        entities = list(entities)
+        prefix = b'{"actionType":' + dumps(action_type) + b',"entities":['
+        results = []
+
+        for start in range(0, len(entities), batch_size):
+            chunk = entities[start:start + batch_size]
+            body = prefix + b','.join(encode_item(entity) for entity in chunk) + b']}'
+            response = self.post('/v2/op/update', body, params)
+            results.append((chunk, response))
+
+        return results
+
+    # Stream every entity of a type from /v2/entities, one page of page_size
+    # entities per request. keyValues leaves out attribute types and metadata.
+    def iter_entities(self, entity_type, page_size=PAGE_SIZE, key_values=True):
+        params = {'type': entity_type, 'limit': page_size, 'offset': 0}
+        if key_values:
+            params['options'] = 'keyValues'
+
+        while True:
+            response = self.get('/v2/entities', params)
+            response.raise_for_status()
+            page = response.json()
+            yield from page
+            if len(page) < page_size:
+                return
+            params['offset'] += len(page)
+
+    def close(self):
+        self.session.close()
+
+# Shared clients, one per base URL
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(base_url=None):
+    base_url = base_url or ORION_URL
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = OrionClient(base_url)
+            _clients[base_url] = client
+        return client
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configuration
+STUB_HOST = os.getenv('ORION_STUB_HOST', '127.0.0.1')
+STUB_PORT = int(os.getenv('ORION_STUB_PORT', '1026'))
+
+# Orion's default and maximum page sizes for entity listings
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 1000
+
+# NGSI-v2 type for a keyValues attribute value
+def infer_type(value):
+    if isinstance(value, bool):
+        return 'Boolean'
+    if isinstance(value, (int, float)):
+        return 'Number'
+    if isinstance(value, str):
+        return 'Text'
+    if isinstance(value, dict) and 'coordinates' in value:
+        return 'geo:json'
+    return 'StructuredValue'
+
+# A DateTime value as Orion renders it: UTC with millisecond precision and
+# a trailing "Z". Values without an offset are taken as UTC, as Orion does.
+def orion_datetime(value):
+    try:
+        parsed = datetime.datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    except (AttributeError, TypeError, ValueError):
+        return value
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed.strftime('%Y-%m-%dT%H:%M:%S.') + f"{parsed.microsecond // 1000:03d}Z"
+
+# Rewrite the DateTime value and metadata of a normalized attribute as Orion stores them
+def _store_datetimes(attribute):
+    if attribute['type'] == 'DateTime':
+        attribute['value'] = orion_datetime(attribute['value'])
+    for metadata in attribute['metadata'].values():
+        if isinstance(metadata, dict) and metadata.get('type') == 'DateTime':
+            metadata['value'] = orion_datetime(metadata.get('value'))
+    return attribute
+
+# Normalize the attributes of an incoming entity or attribute payload
+def normalize(attributes, key_values):
+    normalized = {}
+    for name, attribute in attributes.items():
+        if name in ('id', 'type'):
+            continue
+        if key_values:
+            attribute = {'type': infer_type(attribute), 'value': attribute}
+        normalized[name] = _store_datetimes({
+            'type': attribute.get('type', infer_type(attribute.get('value'))),
+            'value': attribute.get('value'),
+            'metadata': dict(attribute.get('metadata', {}))
+        })
+    return normalized
+
+# Render a stored entity, optionally in keyValues form
+def render(entity, key_values):
+    if not key_values:
+        return entity
+    rendered = {'id': entity['id'], 'type': entity['type']}
+    for name, attribute in entity.items():
+        if name not in ('id', 'type'):
+            rendered[name] = attribute['value']
+    return rendered
+
+# In-memory NGSI-v2 entity and subscription store with request counters
+class StubState:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.entities = {}
+        self.subscriptions = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = {}
+            self.statuses = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.entity_writes = 0
+
+    def record(self, route, status, bytes_in, bytes_out):
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'statuses': dict(self.statuses),
+                'bytesIn': self.bytes_in,
+                'bytesOut': self.bytes_out,
+                'entityWrites': self.entity_writes,
+                'entities': len(self.entities),
+                'subscriptions': len(self.subscriptions)
+            }
+
+    # Create, update or replace entities as /v2/op/update does. Returns the
+    # entities that failed: the IDs of entities that do not exist for update
+    # and replace, and for append_strict the entities with attributes that
+    # already exist, as "id - [ names ]". Like Orion, append_strict still adds
+    # the attributes that are new.
+    def apply(self, action_type, entities, key_values):
+        failed = []
+        with self.lock:
+            for entity in entities:
+                entity_id = entity['id']
+                attributes = normalize(entity, key_values)
+                stored = self.entities.get(entity_id)
+
+                if action_type == 'delete':
+                    self.entities.pop(entity_id, None)
+                elif stored is None:
+                    if action_type in ('update', 'replace'):
+                        failed.append(entity_id)
+                        continue
+                    stored = self.entities[entity_id] = {'id': entity_id, 'type': entity.get('type', 'Thing')}
+                    stored.update(attributes)
+                elif action_type == 'replace':
+                    self.entities[entity_id] = {'id': entity_id, 'type': stored['type'], **attributes}
+                elif action_type == 'append_strict':
+                    existing = [name for name in attributes if name in stored]
+                    if existing:
+                        failed.append(f"{entity_id} - [ {', '.join(existing)} ]")
+                    stored.update((name, attribute) for name, attribute in attributes.items() if name not in stored)
+                else:
+                    stored.update(attributes)
+                self.entity_writes += 1
+        return failed
+
+# Request handler implementing the subset of NGSI-v2 used by the simulator
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'OrionStub/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.bytes_in = length
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length))
+
+    def _send(self, status, payload=None, headers=None):
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        # Count the request before replying so clients never see stale stats
+        self.server.state.record(self.route, status, self.bytes_in, len(body))
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, error, description):
+        self._send(status, {'error': error, 'description': description})
+
+    def _handle(self, method):
+        state = self.server.state
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        key_values = 'keyValues' in query.get('options', '').split(',')
+        self.bytes_in = 0
+        self.route = f"{method} {url.path}"
+
+        try:
+            body = self._read_body()
+        except ValueError:
+            return self._error(400, 'ParseError', 'Errors found in incoming JSON buffer')
+
+        # Stub control endpoints are never delayed or failed
+        if parts[0] == 'stub':
+            self.route = f"{method} /{'/'.join(parts)}"
+            if parts[1:] == ['stats'] and method == 'GET':
+                return self._send(200, state.stats())
+            if parts[1:] == ['reset'] and method == 'POST':
+                state.reset_stats()
+                return self._send(204)
+            return self._error(404, 'NotFound', 'No such stub endpoint')
+
+        if state.latency or state.jitter:
+            time.sleep(state.latency + random.uniform(0, state.jitter))
+        if state.error_rate and random.random() < state.error_rate:
+            return self._error(503, 'ServiceUnavailable', 'Injected error')
+
+        if parts[:2] == ['v2', 'entities']:
+            # Collapse entity IDs so counters group by endpoint
+            if len(parts) == 2:
+                return self._entities(method, body, query, key_values)
+            self.route = f"{method} /v2/entities/{{id}}" + ('/attrs' if parts[3:] == ['attrs'] else '')
+            return self._entity(method, parts[2], parts[3:], body, key_values)
+        if parts == ['v2', 'op', 'update'] and method == 'POST':
+            return self._op_update(body, key_values)
+        if parts == ['v2', 'subscriptions']:
+            return self._subscriptions(method, body)
+        return self._error(404, 'NotFound', 'No context element found')
+
+    # /v2/entities
+    def _entities(self, method, body, query, key_values):
+        state = self.server.state
+        if method == 'POST':
+            if not body or 'id' not in body:
+                return self._error(400, 'BadRequest', 'Missing entity id')
+            with state.lock:
+                exists = body['id'] in state.entities
+            if exists:
+                return self._error(422, 'Unprocessable', 'Already Exists')
+            state.apply('append', [body], key_values)
+            return self._send(201, headers={'Location': f"/v2/entities/{body['id']}?type={body.get('type', 'Thing')}"})
+
+        if method == 'GET':
+            limit = min(int(query.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+            offset = int(query.get('offset', 0))
+            entity_type = query.get('type')
+            with state.lock:
+                matching = [entity for entity in state.entities.values()
+                            if entity_type is None or entity['type'] == entity_type]
+                page = [render(entity, key_values) for entity in matching[offset:offset + limit]]
+            headers = {}
+            if 'count' in query.get('options', '').split(','):
+                headers['Fiware-Total-Count'] = str(len(matching))
+            return self._send(200, page, headers)
+
+        return self._error(405, 'MethodNotAllowed', 'Method not allowed')
+
+    # /v2/entities/{id} and /v2/entities/{id}/attrs
+    def _entity(self, method, entity_id, rest, body, key_values):
+        state = self.server.state
+        if method == 'GET' and not rest:
+            with state.lock:
+                entity = state.entities.get(entity_id)
+                entity = entity and render(entity, key_values)
+            if entity is None:
+                return self._error(404, 'NotFound', 'The requested entity has not been found. Check type and id')
+            return self._send(200, entity)
+
+        if method == 'PATCH' and rest == ['attrs']:
+            if state.apply('update', [{'id': entity_id, **(body or {})}], key_values):
+                return self._error(404, 'NotFound', 'The requested entity has not been found. Check type and id')
+            return self._send(204)
+
+        if method == 'DELETE' and not rest:
+            state.apply('delete', [{'id': entity_id}], False)
+            return self._send(204)
+
+        return self._error(405, 'MethodNotAllowed', 'Method not allowed')
+
+    # /v2/op/update
+    def _op_update(self, body, key_values):
+        action_type = (body or {}).get('actionType')
+        if action_type not in ('append', 'append_strict', 'update', 'replace', 'delete'):
+            return self._error(400, 'BadRequest', f"invalid actionType: {action_type}")
+        failed = self.server.state.apply(action_type, body.get('entities', []), key_values)
+        if failed and action_type == 'append_strict':
+            return self._error(422, 'Unprocessable',
+                               f"one or more of the attributes in the request already exist: {', '.join(failed)}")
+        if failed:
+            return self._error(404, 'PartialUpdate', f"do not exist: {', '.join(failed)}")
+        return self._send(204)
+
+    # /v2/subscriptions
+    def _subscriptions(self, method, body):
+        state = self.server.state
+        if method == 'POST':
+            with state.lock:
+                subscription_id = f"{len(state.subscriptions) + 1:024x}"
+                state.subscriptions[subscription_id] = {'id': subscription_id, **(body or {})}
+            return self._send(201, headers={'Location': f"/v2/subscriptions/{subscription_id}"})
+        if method == 'GET':
+            with state.lock:
+                subscriptions = list(state.subscriptions.values())
+            return self._send(200, subscriptions)
+        return self._error(405, 'MethodNotAllowed', 'Method not allowed')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+# Local stand-in for Orion, served from a background thread so it can run
+# inside a benchmark or test process. Port 0 picks a free port.
+class OrionStub:
+    def __init__(self, host=STUB_HOST, port=STUB_PORT, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.server = ThreadingHTTPServer((host, port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.state = StubState(latency, jitter, error_rate)
+        self.thread = None
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Orion Context Broker stand-in for load and integration testing')
+    parser.add_argument('--host', default=STUB_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=STUB_PORT, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random seconds added on top of --latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+
+    args = parser.parse_args()
+
+    stub = OrionStub(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Orion stand-in listening on {stub.url} (stats at {stub.url}/stub/stats)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping Orion stand-in")
+        print(json.dumps(stub.state.stats(), indent=2))
+        stub.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import os
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+# Where --profile output goes, how many ticks each profile window spans, how
+# many windows are recorded (0 for all of them) and how many entries the exit
+# summary lists
+PROFILE_DIR = os.getenv('SIM_PROFILE_DIR', 'profiles')
+PROFILE_WINDOW = int(os.getenv('SIM_PROFILE_WINDOW', '50'))
+PROFILE_WINDOWS = int(os.getenv('SIM_PROFILE_WINDOWS', '0'))
+PROFILE_TOP = int(os.getenv('SIM_PROFILE_TOP', '15'))
+
+# Stack frames kept per traced allocation
+TRACE_FRAMES = 10
+
+# Allocations made by the profiling itself, left out of the snapshots
+IGNORED_TRACES = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile)]
+
+# Profiles simulation ticks in windows of `window` ticks. Each window is
+# written as window-NNN.prof, cProfile stats readable by pstats, snakeviz or
+# gprof2dot, and window-NNN.tracemalloc, a tracemalloc snapshot of the memory
+# allocated since profiling started that is still alive, readable with
+# tracemalloc.Snapshot.load(). Ticks from every engine share one profile;
+# they run one at a time, since cProfile can only profile one of them at once.
+# Allocation tracing starts with the first profiled tick, so setting up the
+# airport is left out.
+class Profiler:
+    def __init__(self, directory=PROFILE_DIR, window=PROFILE_WINDOW, windows=PROFILE_WINDOWS, top=PROFILE_TOP):
+        self.directory = directory
+        self.window = window
+        self.windows = windows
+        self.top = top
+        self.lock = threading.Lock()
+        self.profile = cProfile.Profile()
+        self.ticks = 0
+        self.index = 0
+        self.files = []
+        # Allocation snapshots of the first and the latest window
+        self.first = None
+        self.last = None
+        self.closed = False
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def active(self):
+        return not self.closed and (not self.windows or self.index < self.windows)
+
+    # Wrap a tick function so every call is profiled
+    def wrap(self, function):
+        def profiled(*args, **kwargs):
+            return self.call(function, *args, **kwargs)
+        profiled.__name__ = function.__name__
+        return profiled
+
+    # Call a function under the profiler, closing the window after `window`
+    # calls. Once profiling has stopped, calls go straight through without
+    # taking the lock.
+    def call(self, function, *args, **kwargs):
+        if not self.active:
+            return function(*args, **kwargs)
+        with self.lock:
+            if not self.active:
+                return function(*args, **kwargs)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+
+            self.profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.profile.disable()
+                self.ticks += 1
+                if self.ticks == self.window:
+                    self._dump()
+
+    # Write the current window's profile and allocation snapshot
+    def _dump(self):
+        path = os.path.join(self.directory, f"window-{self.index:03d}")
+        self.profile.dump_stats(f"{path}.prof")
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+        snapshot.dump(f"{path}.tracemalloc")
+        self.files.append(f"{path}.prof")
+        if self.first is None:
+            self.first = snapshot
+        self.last = snapshot
+        print(f"Profiled {self.ticks} ticks into {path}.prof and {path}.tracemalloc")
+
+        self.profile = cProfile.Profile()
+        self.ticks = 0
+        self.index += 1
+        if not self.active:
+            tracemalloc.stop()
+
+    # Write the partial last window, stop tracing and print a summary of the
+    # hottest functions and the largest and fastest-growing allocation sites
+    def close(self):
+        with self.lock:
+            if self.ticks and self.active:
+                self._dump()
+            self.closed = True
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+        if not self.files:
+            print("No ticks were profiled")
+            return
+
+        print(f"\nTop {self.top} functions by cumulative time over {len(self.files)} profile windows:")
+        pstats.Stats(*self.files).strip_dirs().sort_stats('cumulative').print_stats(self.top)
+
+        print(f"Top {self.top} allocation sites still alive after the last window:")
+        for statistic in self.last.statistics('lineno')[:self.top]:
+            print(f"  {statistic}")
+        if self.last is not self.first:
+            print(f"Top {self.top} allocation sites by growth since the first window:")
+            for statistic in self.last.compare_to(self.first, 'lineno')[:self.top]:
+                print(f"  {statistic}")
+        print(f"Profiles written to {self.directory}")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import datetime
+import requests
+from orion_client import get_client, BATCH_SIZE
+from circuit import CircuitOpenError, CLOSED
+
+# Configuration
+ORION_URL = os.getenv('ORION_URL', 'http://localhost:1026')
+
+# How often to print progress while replaying, in seconds
+REPORT_INTERVAL = 10
+
+# Records due within this many seconds of each other share a batch
+BATCH_WINDOW = 0.01
+
+# Backoffs the client's circuit breaker may go through in a row before the
+# replay gives up on an unreachable Orion
+MAX_BACKOFFS = int(os.getenv('REPLAY_MAX_BACKOFFS', '5'))
+
+# Recorded operations and the /v2/op/update action used to replay them
+ACTION_TYPES = {
+    'create': 'append',
+    'append': 'append',
+    'update': 'update',
+    'delete': 'delete'
+}
+
+# Lazily read (time, op, entity) records from an NDJSON update log written by
+# the simulator's ndjson sink, or from standard input for "-" (the stdout
+# sink). Gzip-compressed logs are detected by suffix.
+def read_records(path):
+    if path == '-':
+        f = sys.stdin
+    else:
+        f = (gzip.open if path.endswith('.gz') else open)(path, 'rt', encoding='utf-8')
+    with f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield datetime.datetime.fromisoformat(record['time']), record['op'], record['entity']
+
+# Raised when Orion stays unreachable for MAX_BACKOFFS circuit backoffs
+class ReplayAborted(Exception):
+    pass
+
+# Throughput counters for a replay
+class ReplayStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.entities = 0
+        self.requests = 0
+        self.failures = 0
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.entities / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        print(f"Replayed {self.entities} entities in {self.requests} requests over {elapsed:.1f}s "
+              f"({self.rate():.0f} entities/s, {self.failures} failed requests)")
+
+# Send one batch of entities with a single action type, one request per
+# chunk. A chunk that cannot be sent counts as a failed request and the
+# replay moves on; while the circuit is open the replay waits out the
+# backoff, and gives up once the circuit has opened MAX_BACKOFFS times in a row.
+def send_batch(client, action_type, entities, batch_size, stats, params=None):
+    for start in range(0, len(entities), batch_size):
+        chunk = entities[start:start + batch_size]
+        stats.requests += 1
+        stats.entities += len(chunk)
+        try:
+            (_, response), = client.batch_update(chunk, action_type, batch_size, params)
+        except (CircuitOpenError, requests.RequestException) as e:
+            stats.failures += 1
+            print(f"Failed batch {action_type} of {len(chunk)} entities: {e}")
+            breaker = client.breaker
+            if breaker.state != CLOSED:
+                if breaker.opens >= MAX_BACKOFFS:
+                    raise ReplayAborted(f"{client.base_url} is still unreachable after {breaker.opens} backoffs")
+                time.sleep(max(0.0, breaker.retry_at - time.monotonic()))
+            continue
+        if response.status_code != 204:
+            stats.failures += 1
+            print(f"Failed batch {action_type} of {len(chunk)} entities: {response.status_code} {response.text}")
+
+# Replay a recorded update log into Orion. With a speed factor the original
+# inter-arrival times are kept, divided by speed; with speed=None records are
+# sent as fast as Orion accepts them. Records that are due at about the same
+# time are grouped into /v2/op/update batches of up to batch_size entities.
+# Logs recorded with the keyValues payload profile need key_values=True.
+def replay(path, client, speed=1.0, batch_size=BATCH_SIZE, upsert=False, stats=None, key_values=False):
+    stats = stats or ReplayStats()
+    params = {'options': 'keyValues'} if key_values else None
+    start_wall = time.monotonic()
+    start_time = None
+    batch = []
+    batch_action = None
+
+    for recorded_at, op, entity in read_records(path):
+        action_type = ACTION_TYPES.get(op, 'update')
+        if upsert and action_type != 'delete':
+            action_type = 'append'
+
+        if speed is not None:
+            if start_time is None:
+                start_time = recorded_at
+            due = start_wall + (recorded_at - start_time).total_seconds() / speed
+            delay = due - time.monotonic()
+            if delay > BATCH_WINDOW:
+                # Nothing more is due yet, so send what we have before waiting
+                if batch:
+                    send_batch(client, batch_action, batch, batch_size, stats, params)
+                    batch = []
+                time.sleep(delay)
+
+        if batch and (action_type != batch_action or len(batch) >= batch_size):
+            send_batch(client, batch_action, batch, batch_size, stats, params)
+            batch = []
+        batch_action = action_type
+        batch.append(entity)
+
+        if time.monotonic() - stats.last_report >= REPORT_INTERVAL:
+            stats.last_report = time.monotonic()
+            stats.report()
+
+    if batch:
+        send_batch(client, batch_action, batch, batch_size, stats, params)
+
+    return stats
+
+# Parse a speed factor, which must be above zero
+def positive_float(value):
+    speed = float(value)
+    if not speed > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0: {value}")
+    return speed
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded Airport Digital Twin update log into Orion')
+    parser.add_argument('path', help='NDJSON update log written by simulator.py --sink ndjson (optionally .gz), '
+                                     'or - to read --sink stdout output from standard input')
+    parser.add_argument('--speed', type=positive_float, default=1.0,
+                        help='Replay this many times faster than recorded (default 1)')
+    parser.add_argument('--fast', action='store_true',
+                        help='Ignore recorded timing and replay as fast as possible')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Entities per /v2/op/update request')
+    parser.add_argument('--upsert', action='store_true',
+                        help='Send every create and update as an append so entities are created if missing')
+    parser.add_argument('--key-values', action='store_true',
+                        help='The log was recorded with --payload-profile keyValues')
+    parser.add_argument('--orion-url', default=ORION_URL, help='Orion Context Broker URL')
+
+    args = parser.parse_args()
+
+    print(f"Replaying {args.path} into {args.orion_url}...")
+    stats = ReplayStats()
+    try:
+        replay(args.path, get_client(args.orion_url), None if args.fast else args.speed,
+               args.batch_size, args.upsert, stats, args.key_values)
+    except KeyboardInterrupt:
+        print("\nReplay stopped by user")
+    except ReplayAborted as e:
+        print(f"Replay stopped: {e}")
+    stats.report()
+
+if __name__ == "__main__":
+    main()
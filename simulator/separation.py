@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import os
+import numpy as np
+from fleet import AIRBORNE
+from entities import SeparationAlert
+
+# Separation minima: pairs closer than both are in conflict
+HORIZONTAL_MINIMUM = float(os.getenv('SEPARATION_HORIZONTAL_NM', '5'))
+VERTICAL_MINIMUM = float(os.getenv('SEPARATION_VERTICAL_FT', '1000'))
+
+# Nautical miles per degree of latitude
+NM_PER_DEGREE = 60.0
+
+# Grid cell coordinates are packed into one integer key: 16 bits each for the
+# offset x and y cells and the altitude band
+CELL_OFFSET = 1 << 15
+
+def cell_key(ix, iy, iz):
+    return ((ix + CELL_OFFSET) << 32) | ((iy + CELL_OFFSET) << 16) | iz
+
+# Neighbouring cells that follow a cell in key order. Checking a cell against
+# itself and these 13 neighbours visits every adjacent pair of cells once.
+FORWARD_NEIGHBOURS = [
+    (dx << 32) + (dy << 16) + dz
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)
+]
+
+# Loss-of-separation monitor backed by a uniform grid over projected
+# horizontal position (nautical miles) and altitude. Cells are as large as
+# the minima, so any conflicting pair sits in the same or adjacent cells.
+# Only flights whose cell changed since the last update are moved in the
+# index, and each tick only checks pairs from neighbouring cells instead of
+# every pair in the fleet.
+#
+# Alerts are only kept while they last: a pair that separates gets a final
+# 'resolved' status, and its alert entity is deleted on the next check, once
+# the resolved status has been written, unless the pair is in conflict again.
+class SeparationMonitor:
+    def __init__(self, horizontal=HORIZONTAL_MINIMUM, vertical=VERTICAL_MINIMUM):
+        self.horizontal = horizontal
+        self.vertical = vertical
+        self.cells = {}
+        self.keys = np.empty(0, dtype=np.int64)
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.alerts = {}
+        self.resolved = {}
+        self.expired = []
+
+    # Re-index the airborne flights of a FleetEngine after it has stepped
+    def update(self, fleet):
+        self.y = fleet.lat * NM_PER_DEGREE
+        self.x = fleet.lng * NM_PER_DEGREE * np.cos(np.radians(fleet.lat))
+        ix = np.floor(self.x / self.horizontal).astype(np.int64)
+        iy = np.floor(self.y / self.horizontal).astype(np.int64)
+        iz = np.floor(fleet.altitude / self.vertical).astype(np.int64)
+        keys = np.where(fleet.status == AIRBORNE, cell_key(ix, iy, iz), -1)
+
+        if len(self.keys) != len(keys):
+            self.cells = {}
+            self.keys = np.full(len(keys), -1, dtype=np.int64)
+
+        moved = np.flatnonzero(keys != self.keys)
+        for row, old, new in zip(moved.tolist(), self.keys[moved].tolist(), keys[moved].tolist()):
+            if old >= 0:
+                cell = self.cells[old]
+                cell.discard(row)
+                if not cell:
+                    del self.cells[old]
+            if new >= 0:
+                self.cells.setdefault(new, set()).add(row)
+        self.keys = keys
+
+    # Candidate pairs of rows from the same or adjacent cells
+    def _candidates(self):
+        first, second = [], []
+        cells = self.cells
+        for key, rows in cells.items():
+            if len(rows) > 1:
+                ordered = sorted(rows)
+                for i, a in enumerate(ordered):
+                    for b in ordered[i + 1:]:
+                        first.append(a)
+                        second.append(b)
+            for offset in FORWARD_NEIGHBOURS:
+                other = cells.get(key + offset)
+                if other:
+                    for a in rows:
+                        for b in other:
+                            first.append(a)
+                            second.append(b)
+        return np.array(first, dtype=np.int64), np.array(second, dtype=np.int64)
+
+    # Pairs of rows inside both minima, with their horizontal (nm) and
+    # vertical (ft) separation
+    def conflicts(self, fleet):
+        a, b = self._candidates()
+        if not len(a):
+            return []
+        horizontal = np.hypot(self.x[a] - self.x[b], self.y[a] - self.y[b])
+        vertical = np.abs(fleet.altitude[a] - fleet.altitude[b])
+        inside = np.flatnonzero((horizontal < self.horizontal) & (vertical < self.vertical))
+        return list(zip(a[inside].tolist(), b[inside].tolist(),
+                        horizontal[inside].tolist(), vertical[inside].tolist()))
+
+    # Check the fleet and return SeparationAlert changes: new alerts in full,
+    # updated distances for ongoing ones, and a final 'resolved' status for
+    # pairs that are separated again
+    def check(self, fleet, timestamp):
+        changes = []
+        active = {}
+
+        for a, b, horizontal, vertical in self.conflicts(fleet):
+            first, second = sorted((fleet.ids[a], fleet.ids[b]))
+            location = (float(fleet.lat[a] + fleet.lat[b]) / 2, float(fleet.lng[a] + fleet.lng[b]) / 2)
+            alert = self.alerts.get((first, second))
+            if alert is None:
+                alert = SeparationAlert(
+                    f"SeparationAlert:{first.split(':')[-1]}-{second.split(':')[-1]}", timestamp,
+                    flights=[first, second],
+                    status='active',
+                    horizontalDistance=round(horizontal, 2),
+                    verticalDistance=int(vertical),
+                    location=location
+                )
+                changes.append(alert.to_ngsi())
+            else:
+                alert.set('horizontalDistance', round(horizontal, 2), timestamp)
+                alert.set('verticalDistance', int(vertical), timestamp)
+                alert.set('location', location, timestamp)
+                alert_changes = alert.pop_changes()
+                if alert_changes:
+                    changes.append(alert_changes)
+            active[(first, second)] = alert
+
+        # Alerts resolved on the last check expire, unless their pair is in
+        # conflict again and the alert was raised anew under the same ID
+        self.expired.extend(alert.id for pair, alert in self.resolved.items() if pair not in active)
+        self.resolved = {}
+
+        for pair, alert in self.alerts.items():
+            if pair not in active:
+                alert.set('status', 'resolved', timestamp)
+                changes.append(alert.pop_changes())
+                self.resolved[pair] = alert
+
+        self.alerts = active
+        return changes
+
+    # Take the alerts to delete, as /v2/op/update delete entities
+    def pop_expired(self):
+        expired = [{'id': alert_id, 'type': SeparationAlert.TYPE} for alert_id in self.expired]
+        self.expired = []
+        return expired
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+import os
+import heapq
+import itertools
+import datetime
+from clock import parse_timestamp
+
+# Base separation between consecutive movements on one runway, in seconds,
+# at full capacity on a dry runway in good weather
+ARRIVAL_SEPARATION = float(os.getenv('SEQUENCER_ARRIVAL_SEPARATION', '90'))
+DEPARTURE_SEPARATION = float(os.getenv('SEQUENCER_DEPARTURE_SEPARATION', '60'))
+
+# Number of upcoming movements published per runway queue
+SEQUENCE_HORIZON = int(os.getenv('SEQUENCER_HORIZON', '10'))
+
+# Separation multipliers for runway surface conditions
+SURFACE_FACTORS = {
+    'dry': 1.0,
+    'wet': 1.2,
+    'snow': 1.5,
+    'ice': 2.0
+}
+
+# Departures further along the ground process go first
+DEPARTURE_PRIORITY = {
+    'taxiing': 0,
+    'boarding': 1,
+    'scheduled': 2
+}
+
+# Runway operation serving each queue
+OPERATIONS = {
+    'arrival': 'landing',
+    'departure': 'takeoff'
+}
+
+# Seconds since the epoch for an ISO timestamp, or +inf when unknown
+def epoch(timestamp):
+    if not timestamp:
+        return float('inf')
+    return parse_timestamp(timestamp).timestamp()
+
+# Priority queue of flights for one runway and operation. Removal marks the
+# heap entry as stale instead of searching for it, so adding, removing and
+# re-prioritizing a flight each cost O(log n). Stale entries are dropped as
+# they reach the top, and the heap is compacted when they pile up.
+class RunwayQueue:
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, flight_id):
+        return flight_id in self.entries
+
+    def push(self, flight_id, key):
+        self.remove(flight_id)
+        entry = [key, next(self.counter), flight_id, True]
+        self.entries[flight_id] = entry
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, flight_id):
+        entry = self.entries.pop(flight_id, None)
+        if entry is None:
+            return False
+        entry[-1] = False
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [entry for entry in self.heap if entry[-1]]
+            heapq.heapify(self.heap)
+        return True
+
+    # The first k (key, flight_id) pairs in order, leaving the queue unchanged
+    def head(self, k):
+        popped = []
+        while self.heap and len(popped) < k:
+            entry = heapq.heappop(self.heap)
+            if entry[-1]:
+                popped.append(entry)
+        for entry in popped:
+            heapq.heappush(self.heap, entry)
+        return [(entry[0], entry[2]) for entry in popped]
+
+    def flight_ids(self):
+        return list(self.entries)
+
+# Arrival and departure sequencing across the airport's runways. Arrivals
+# are ordered by estimated arrival, then scheduled arrival; departures by
+# ground status, then estimated arrival. Each flight is assigned to the
+# least-loaded active runway serving its operation, and only the flights of a
+# runway that stops serving an operation are moved when runway states change.
+class Sequencer:
+    def __init__(self, runways, flights, home_airport='JFK'):
+        self.home_airport = home_airport
+        self.runways = {runway.runwayId: runway for runway in runways}
+        self.flights = flights
+        self.queues = {runway_id: {'arrival': RunwayQueue(), 'departure': RunwayQueue()} for runway_id in self.runways}
+        self.serving = {runway_id: self._serves(runway) for runway_id, runway in self.runways.items()}
+        # Flight ID -> queue currently holding it
+        self.placement = {}
+
+    # Operations ('arrival'/'departure') a runway can currently take
+    def _serves(self, runway):
+        if runway.status != 'active':
+            return set()
+        return {kind for kind, operation in OPERATIONS.items() if runway.operation == operation}
+
+    # Queue a flight belongs in, or None when it no longer needs a runway slot
+    def _kind(self, flight):
+        if flight.destination == self.home_airport and flight.status in ('scheduled', 'airborne'):
+            return 'arrival'
+        if flight.origin == self.home_airport and flight.status in DEPARTURE_PRIORITY:
+            return 'departure'
+        return None
+
+    def _key(self, flight, kind):
+        if kind == 'arrival':
+            return (epoch(flight.estimatedArrival), epoch(flight.scheduledArrival))
+        return (DEPARTURE_PRIORITY[flight.status], epoch(flight.estimatedArrival))
+
+    # Least-loaded runway serving an operation, falling back to any active runway
+    def pick_runway(self, kind):
+        candidates = [runway_id for runway_id, kinds in self.serving.items() if kind in kinds]
+        if not candidates:
+            candidates = [runway_id for runway_id, runway in self.runways.items() if runway.status == 'active']
+        if not candidates:
+            return None
+        return min(candidates, key=lambda runway_id: len(self.queues[runway_id][kind]))
+
+    # Queue, re-queue or drop a flight according to its status and return
+    # its runway. Without a timestamp the runway is assigned silently, for
+    # flights that have not been published yet.
+    def update_flight(self, flight, timestamp=None):
+        kind = self._kind(flight)
+        if kind is None:
+            self.remove_flight(flight.id)
+            return flight.assignedRunway
+
+        runway_id = flight.assignedRunway
+        if runway_id not in self.queues or kind not in self.serving[runway_id]:
+            runway_id = self.pick_runway(kind)
+        if runway_id is None:
+            return flight.assignedRunway
+
+        self.remove_flight(flight.id)
+        queue = self.placement[flight.id] = self.queues[runway_id][kind]
+        queue.push(flight.id, self._key(flight, kind))
+        if timestamp is None:
+            flight.assignedRunway = runway_id
+        else:
+            flight.set('assignedRunway', runway_id, timestamp)
+        return runway_id
+
+    # Drop a flight from whichever queue holds it
+    def remove_flight(self, flight_id):
+        queue = self.placement.pop(flight_id, None)
+        return queue is not None and queue.remove(flight_id)
+
+    # Re-plan after runway state changes. Flights queued on a runway that no
+    # longer serves their operation are moved to another runway; all other
+    # queues are left untouched. Returns the IDs of the moved flights.
+    def update_runways(self, timestamp):
+        lost = {}
+        for runway_id, runway in self.runways.items():
+            serving = self._serves(runway)
+            lost[runway_id] = self.serving[runway_id] - serving
+            self.serving[runway_id] = serving
+
+        moved = []
+        for runway_id, kinds in lost.items():
+            for kind in kinds:
+                queue = self.queues[runway_id][kind]
+                for flight_id in queue.flight_ids():
+                    queue.remove(flight_id)
+                    flight = self.flights[flight_id]
+                    new_runway = self.pick_runway(kind) or runway_id
+                    new_queue = self.placement[flight_id] = self.queues[new_runway][kind]
+                    new_queue.push(flight_id, self._key(flight, kind))
+                    flight.set('assignedRunway', new_runway, timestamp)
+                    moved.append(flight_id)
+        return moved
+
+    # Seconds between consecutive movements on a runway given its capacity,
+    # surface, visibility and the wind
+    def separation(self, runway, kind, weather=None):
+        base = ARRIVAL_SEPARATION if kind == 'arrival' else DEPARTURE_SEPARATION
+        capacity = max(runway.currentCapacity or 0, 10) / 100
+        factor = SURFACE_FACTORS.get(runway.surfaceCondition, 1.0)
+
+        visibility = runway.visibility if runway.visibility is not None else 10
+        if visibility < 2:
+            factor *= 1.5
+        elif visibility < 5:
+            factor *= 1.25
+
+        if weather is not None and weather.windSpeed is not None:
+            if weather.windSpeed > 30:
+                factor *= 1.5
+            elif weather.windSpeed > 20:
+                factor *= 1.2
+
+        return round(base * factor / capacity, 1)
+
+    # Length and first k (key, flight_id) pairs of every queue, by (runway_id, kind)
+    def heads(self, k=SEQUENCE_HORIZON):
+        return {(runway_id, kind): (len(queue), queue.head(k))
+                for runway_id, queues in self.queues.items() for kind, queue in queues.items()}
+
+    # Publish the upcoming sequence of every runway queue into its
+    # RunwayStatus entity: slot times for the next SEQUENCE_HORIZON flights,
+    # queue lengths and the separation in force. Sharded simulations pass
+    # the heads merged from every shard's sequencer instead of their own.
+    def publish(self, now, timestamp, weather=None, heads=None):
+        if heads is None:
+            heads = self.heads()
+        for runway_id, runway in self.runways.items():
+            for kind in ('arrival', 'departure'):
+                length, head = heads[(runway_id, kind)]
+                separation = self.separation(runway, kind, weather)
+                slots = []
+                slot = now.timestamp() - separation
+                for key, flight_id in head:
+                    earliest = key[0] if kind == 'arrival' else now.timestamp()
+                    slot = max(earliest, slot + separation)
+                    slots.append({
+                        'flight': flight_id,
+                        'slot': datetime.datetime.fromtimestamp(slot).isoformat()
+                    })
+                runway.set(f"{kind}Sequence", slots, timestamp)
+                runway.set(f"{kind}QueueLength", length, timestamp)
+                runway.set(f"{kind}Separation", separation, timestamp)
+
+# Sequencing across a network of airports, with one Sequencer per airport
+# over the same flights. Each flight is queued at the airport whose runways
+# it needs next: its origin while it waits there on the ground, otherwise its
+# destination. Flights airborne to an airport outside the network leave
+# their origin's queues. Runway IDs are unique across the network, so queues
+# and heads are keyed by runway as for a single airport.
+class NetworkSequencer:
+    def __init__(self, airports, runways, flights):
+        runways = {runway.id: runway for runway in runways}
+        self.flights = flights
+        self.sequencers = {
+            code: Sequencer([runways[runway_id] for runway_id in airport.runway_ids if runway_id in runways],
+                            flights, code)
+            for code, airport in airports.items()
+        }
+        self.queues = {runway_id: queues for sequencer in self.sequencers.values()
+                       for runway_id, queues in sequencer.queues.items()}
+        # Flight ID -> code of the airport queuing it
+        self.placement = {}
+
+    # Airport whose runways a flight needs next, or None when it needs none here
+    def _airport(self, flight):
+        if flight.status in DEPARTURE_PRIORITY and flight.origin in self.sequencers:
+            return flight.origin
+        if flight.destination in self.sequencers:
+            return flight.destination
+        if flight.origin in self.sequencers:
+            return flight.origin
+        return None
+
+    # Queue, re-queue or drop a flight at the airport it needs next and return
+    # its runway, as Sequencer.update_flight()
+    def update_flight(self, flight, timestamp=None):
+        code = self._airport(flight)
+        previous = self.placement.get(flight.id)
+        if previous is not None and previous != code:
+            self.sequencers[previous].remove_flight(flight.id)
+        if code is None:
+            self.placement.pop(flight.id, None)
+            return flight.assignedRunway
+        self.placement[flight.id] = code
+        return self.sequencers[code].update_flight(flight, timestamp)
+
+    def remove_flight(self, flight_id):
+        code = self.placement.pop(flight_id, None)
+        return code is not None and self.sequencers[code].remove_flight(flight_id)
+
+    # Least-loaded runway of an airport for an operation, or None outside the network
+    def pick_runway(self, kind, code):
+        sequencer = self.sequencers.get(code)
+        return sequencer.pick_runway(kind) if sequencer is not None else None
+
+    def update_runways(self, timestamp):
+        moved = []
+        for sequencer in self.sequencers.values():
+            moved.extend(sequencer.update_runways(timestamp))
+        return moved
+
+    def heads(self, k=SEQUENCE_HORIZON):
+        heads = {}
+        for sequencer in self.sequencers.values():
+            heads.update(sequencer.heads(k))
+        return heads
+
+    # Publish every airport's sequences, with weather as {code: WeatherCondition}
+    def publish(self, now, timestamp, weather=None, heads=None):
+        if heads is None:
+            heads = self.heads()
+        for code, sequencer in self.sequencers.items():
+            sequencer.publish(now, timestamp, (weather or {}).get(code), heads)
+
+# Merge the heads() of sequencers holding disjoint sets of flights, such as
+# the shards of one fleet, into the heads of one sequencer holding them all
+def merge_heads(heads, k=SEQUENCE_HORIZON):
+    return {queue: (sum(shard[queue][0] for shard in heads),
+                    list(itertools.islice(heapq.merge(*(shard[queue][1] for shard in heads)), k)))
+            for queue in heads[0]}
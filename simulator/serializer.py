@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+import json
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON encoder used for payloads: orjson when installed, otherwise the
+# standard library
+ENCODERS = ['orjson', 'json'] if orjson is not None else ['json']
+ENCODER = ENCODERS[0]
+
+# Encode any JSON value to compact bytes
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+# Encode a payload that may already be JSON bytes
+def encode_item(item):
+    return item if isinstance(item, bytes) else dumps(item)
+
+# Decode JSON bytes
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Id of an entity payload, a dict or JSON bytes. Encoded entities always start
+# with their id, and NGSI ids cannot contain quotes or backslashes, so the id
+# is read without decoding the payload.
+def entity_id(item):
+    if isinstance(item, bytes):
+        if not item.startswith(b'{"id":"'):
+            return loads(item)['id']
+        return item[7:item.index(b'"', 7)].decode('utf-8')
+    return item['id']
+
+# Merge two payloads of the same entity, the newer attributes replacing the
+# older ones. Returns a dict.
+def merge_payloads(older, newer):
+    merged = loads(older) if isinstance(older, bytes) else dict(older)
+    merged.update(loads(newer) if isinstance(newer, bytes) else newer)
+    return merged
+
+def _encode_slow(value):
+    return json.dumps(value, separators=(',', ':'))
+
+def _encode_float(value):
+    # NaN and infinities take the slow path, which spells them like json does
+    return float.__repr__(value) if value - value == 0 else _encode_slow(value)
+
+def _encode_point(value):
+    return '{"type":"Point","coordinates":[%s]}' % ','.join(encode_value(item) for item in value)
+
+_VALUE_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+    tuple: _encode_point
+}
+
+# Encode one attribute value as a JSON string with the standard library.
+# Scalars skip json.dumps; (lat, lng) tuples are written as geo:json Points
+# like Entity does.
+def encode_value(value):
+    return _VALUE_ENCODERS.get(type(value), _encode_slow)(value)
+
+# geo:json value of a (lat, lng) tuple for orjson, or the value itself
+def _geo(value):
+    return {'type': 'Point', 'coordinates': value} if type(value) is tuple else value
+
+# Latest of a few ISO timestamps, ignoring missing ones
+def _newest(*timestamps):
+    return max(filter(None, timestamps), default=None)
+
+# Precompiled JSON layout of one set of attributes of an entity type in one
+# payload profile. The static parts (attribute names, types, units and
+# metadata structure) are fixed once, and a renderer specialized to them is
+# generated, so each payload only has to fill in the changing values. With
+# orjson the renderer fills in a dict literal for orjson to encode; with the
+# standard library it fills in a format string. with_id=False leaves out id
+# and type, for /v2/entities/{id}/attrs bodies.
+class Template:
+    def __init__(self, entity_class, names, profile='normalized', with_id=True, encoder=ENCODER):
+        self.entity_class = entity_class
+        self.names = tuple(names)
+        self.profile = profile
+        self.with_id = with_id
+        self.encoder = encoder
+        self.timestamped = [i for i, name in enumerate(self.names) if entity_class.ATTRIBUTES[name][2]]
+        # Compact profiles end with one TimeInstant when any attribute carries a timestamp
+        self.time_instant = profile != 'normalized' and bool(self.timestamped)
+
+        index = entity_class.INDEX
+        self.render = self._compile('entity', 'entity.id', [f"entity.{name}" for name in self.names],
+                                    [f"entity.timestamps[{index[name]}]" for name in self.names])
+        self._fill = self._compile('entity_id, values, timestamps', 'entity_id',
+                                   [f"values[{i}]" for i in range(len(self.names))],
+                                   [f"timestamps[{i}]" for i in range(len(self.names))])
+
+    # Generate the renderer. The expressions read the id, values and
+    # timestamps from the renderer's arguments.
+    def _compile(self, args, id_expr, value_exprs, timestamp_exprs):
+        entity_class = self.entity_class
+        lines = [f"def render({args}):"]
+        if self.time_instant:
+            lines.append(f"    latest = newest({', '.join(timestamp_exprs[i] for i in self.timestamped)})")
+            lines.append("    if latest is None:")
+            lines.append("        return None")
+
+        if self.encoder == 'orjson':
+            items = [f"'id': {id_expr}", f"'type': {entity_class.TYPE!r}"] if self.with_id else []
+            for i, name in enumerate(self.names):
+                attribute_type, unit, timestamped = entity_class.ATTRIBUTES[name]
+                value = f"geo({value_exprs[i]})" if attribute_type == 'geo:json' else value_exprs[i]
+                if self.profile == 'keyValues':
+                    items.append(f"{name!r}: {value}")
+                    continue
+                attribute = f"'type': {attribute_type!r}, 'value': {value}"
+                metadata = []
+                if self.profile == 'normalized':
+                    if unit is not None:
+                        metadata.append(f"'unit': {{'type': 'Text', 'value': {unit!r}}}")
+                    if timestamped:
+                        metadata.append(f"'timestamp': {{'type': 'DateTime', 'value': {timestamp_exprs[i]}}}")
+                if metadata:
+                    attribute += f", 'metadata': {{{', '.join(metadata)}}}"
+                items.append(f"{name!r}: {{{attribute}}}")
+            if self.time_instant:
+                items.append("'TimeInstant': latest" if self.profile == 'keyValues'
+                             else "'TimeInstant': {'type': 'DateTime', 'value': latest}")
+            lines.append(f"    return dumps({{{', '.join(items)}}})")
+            namespace = {'dumps': orjson.dumps, 'geo': _geo, 'newest': _newest}
+        else:
+            fragments, holes = self._format(id_expr, value_exprs, timestamp_exprs)
+            lines.append(f"    return (FORMAT % ({''.join(hole + ', ' for hole in holes)})).encode('utf-8')")
+            namespace = {'FORMAT': fragments, 'enc': encode_value, 'esc': encode_basestring_ascii,
+                         'newest': _newest}
+
+        # Named after the entity type so profiles and tracebacks can tell renderers apart
+        exec(compile('\n'.join(lines), f"<{entity_class.TYPE} template>", 'exec'), namespace)
+        return namespace['render']
+
+    # Format string of the payload and the expressions filling its holes
+    def _format(self, id_expr, value_exprs, timestamp_exprs):
+        def literal(value):
+            return json.dumps(value, separators=(',', ':')).replace('%', '%%')
+
+        entity_class = self.entity_class
+        parts = []
+        holes = []
+        if self.with_id:
+            parts.append('"id":%s,"type":' + literal(entity_class.TYPE))
+            holes.append(f"esc({id_expr})")
+        for i, name in enumerate(self.names):
+            attribute_type, unit, timestamped = entity_class.ATTRIBUTES[name]
+            holes.append(f"enc({value_exprs[i]})")
+            if self.profile == 'keyValues':
+                parts.append(literal(name) + ':%s')
+                continue
+            part = literal(name) + ':{"type":' + literal(attribute_type) + ',"value":%s'
+            metadata = []
+            if self.profile == 'normalized':
+                if unit is not None:
+                    metadata.append('"unit":{"type":"Text","value":' + literal(unit) + '}')
+                if timestamped:
+                    metadata.append('"timestamp":{"type":"DateTime","value":%s}')
+                    holes.append(f"enc({timestamp_exprs[i]})")
+            if metadata:
+                part += ',"metadata":{' + ','.join(metadata) + '}'
+            parts.append(part + '}')
+        if self.time_instant:
+            parts.append('"TimeInstant":%s' if self.profile == 'keyValues'
+                         else '"TimeInstant":{"type":"DateTime","value":%s}')
+            holes.append("enc(latest)")
+        return '{' + ','.join(parts) + '}', holes
+
+    # Render a payload from attribute values in template order. timestamp is
+    # either one timestamp shared by all attributes or a sequence with one per
+    # attribute. Returns None when a compact profile has no timestamp to use.
+    def fill(self, values, timestamp, entity_id=None):
+        if timestamp is None or isinstance(timestamp, str):
+            timestamp = [timestamp] * len(self.names)
+        return self._fill(entity_id, values, timestamp)
+
+# Compiled templates keyed by entity class, attribute names and profile
+_templates = {}
+
+def get_template(entity_class, names, profile):
+    key = (entity_class, names, profile)
+    template = _templates.get(key)
+    if template is None:
+        template = _templates[key] = Template(entity_class, names, profile)
+    return template
+
+# Encode an Entity, or the given attributes of it, as NGSI-v2 JSON bytes.
+# The result is the same document Entity.to_ngsi() returns, without going
+# through its generic dict building.
+def encode_entity(entity, names=None, profile='normalized'):
+    names = tuple(names) if names else entity.NAMES
+    encoded = get_template(type(entity), names, profile).render(entity)
+    if encoded is None:
+        # No timestamp to use as TimeInstant, which the dict form leaves out
+        return dumps(entity.to_ngsi(names, profile))
+    return encoded
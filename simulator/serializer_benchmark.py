@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import sys
+import json
+import timeit
+import argparse
+import functools
+import datetime
+import serializer
+from entities import Flight, RunwayStatus, WeatherCondition
+from serializer import Template, ENCODER, ENCODERS
+
+# Sample entities, as built by the simulator
+def sample_entities():
+    now = datetime.datetime.now().isoformat()
+    flight = Flight(
+        'Flight:UA1234', now,
+        callSign='UA1234',
+        aircraftType='Boeing 787-9',
+        origin='LHR',
+        destination='JFK',
+        status='airborne',
+        position=(41.2345678, -72.3456789),
+        altitude=32000,
+        speed=480,
+        heading=270,
+        scheduledArrival=now,
+        estimatedArrival=now,
+        assignedRunway='RW27L'
+    )
+    runway = RunwayStatus(
+        'RunwayStatus:RW27L', now,
+        runwayId='RW27L',
+        name='Runway 27 Left',
+        length=3500,
+        status='active',
+        operation='landing',
+        visibility=10,
+        surfaceCondition='dry',
+        nextScheduledMaintenance=now,
+        currentCapacity=90,
+        location={'type': 'LineString', 'coordinates': [[40.6413, -73.7781], [40.6550, -73.7925]]},
+        arrivalSequence=[{'flight': 'Flight:UA1234', 'slot': now}],
+        departureSequence=[],
+        arrivalQueueLength=1,
+        departureQueueLength=0,
+        arrivalSeparation=100.0,
+        departureSeparation=66.7
+    )
+    weather = WeatherCondition(
+        'WeatherCondition:Airport1', now,
+        location=(40.6413, -73.7781),
+        temperature=22.4,
+        windSpeed=8.5,
+        windDirection=270,
+        visibility=10,
+        precipitation=0,
+        cloudCoverage=25,
+        weatherAlert=False,
+        condition='partly cloudy'
+    )
+    return flight, runway, weather
+
+# The /attrs body simulate_updates.update_flight() used to build by hand,
+# with a fresh timestamp per attribute
+def legacy_flight_attrs(status, lat, lon, altitude, speed, heading):
+    def timestamp():
+        return {"timestamp": {"value": datetime.datetime.now().isoformat(), "type": "DateTime"}}
+    return {
+        "status": {"value": status, "type": "Text", "metadata": timestamp()},
+        "position": {"value": {"type": "Point", "coordinates": [lat, lon]}, "type": "geo:json", "metadata": timestamp()},
+        "altitude": {"value": altitude, "type": "Number", "metadata": timestamp()},
+        "speed": {"value": speed, "type": "Number", "metadata": timestamp()},
+        "heading": {"value": heading, "type": "Number", "metadata": timestamp()}
+    }
+
+# (name, {method: function returning the encoded payload}, entity) for every
+# case. Entity methods take the entity as their argument.
+def cases(profile):
+    flight, runway, weather = sample_entities()
+    payloads = [
+        ('flight full', flight, None),
+        ('flight position', flight, ('position',)),
+        ('flight kinematics', flight, ('position', 'altitude', 'speed')),
+        ('runway full', runway, None),
+        ('runway sequence', runway, ('arrivalSequence', 'arrivalQueueLength', 'arrivalSeparation')),
+        ('weather changes', weather, ('temperature', 'windSpeed', 'windDirection', 'condition'))
+    ]
+
+    for name, entity, names in payloads:
+        methods = {
+            'dict+json': lambda entity=entity, names=names: json.dumps(entity.to_ngsi(names, profile)).encode('utf-8')
+        }
+        if serializer.orjson is not None:
+            methods['dict+orjson'] = lambda entity=entity, names=names: serializer.orjson.dumps(entity.to_ngsi(names, profile))
+        for encoder in ENCODERS:
+            template = Template(type(entity), names or entity.NAMES, profile, encoder=encoder)
+            methods[f"template+{encoder}"] = template.render
+        yield name, methods, entity
+
+    if profile == 'normalized':
+        values = ('airborne', 41.2345678, -72.3456789, 32000, 480, 270)
+        methods = {'dict+json': lambda: json.dumps(legacy_flight_attrs(*values)).encode('utf-8')}
+        if serializer.orjson is not None:
+            methods['dict+orjson'] = lambda: serializer.orjson.dumps(legacy_flight_attrs(*values))
+        for encoder in ENCODERS:
+            template = Template(Flight, ('status', 'position', 'altitude', 'speed', 'heading'), with_id=False,
+                                encoder=encoder)
+            methods[f"template+{encoder}"] = (
+                lambda template=template: template.fill(['airborne', values[1:3], *values[3:]],
+                                                        datetime.datetime.now().isoformat()))
+        yield 'simulate_updates flight', methods, None
+
+# Time every method of every case, in microseconds per payload
+def run(profile, number, repeat):
+    results = []
+    for name, methods, entity in cases(profile):
+        result = {'case': name, 'profile': profile}
+        for method, function in methods.items():
+            if entity is not None and method.startswith('template'):
+                function = functools.partial(function, entity)
+            best = min(timeit.repeat(function, number=number, repeat=repeat))
+            result[method] = {'us': round(best / number * 1e6, 3), 'bytes': len(function())}
+        result['speedup'] = round(result['dict+json']['us'] / result[f"template+{ENCODER}"]['us'], 2)
+        results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark NGSI payload serialization')
+    parser.add_argument('--profiles', default='normalized,compact,keyValues',
+                        help='Comma-separated payload profiles to benchmark')
+    parser.add_argument('--number', type=int, default=20000, help='Payloads encoded per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs per method; the best is reported')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = {'encoder': serializer.ENCODER, 'results': []}
+    for profile in args.profiles.split(','):
+        for result in run(profile, args.number, args.repeat):
+            report['results'].append(result)
+            timings = ', '.join(f"{method} {timing['us']}us" for method, timing in result.items()
+                                if isinstance(timing, dict))
+            print(f"{profile:10} {result['case']:24} {timings} ({result['speedup']}x)", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
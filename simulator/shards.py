@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+import os
+import zlib
+import signal
+import threading
+import multiprocessing
+import numpy as np
+from orion_client import get_client
+from fleet import FleetEngine, STATUSES
+from entities import Flight, RunwayStatus, set_profile
+from sequencer import NetworkSequencer, merge_heads
+from weather import WeatherGrid
+from generator import bootstrap, chunked
+from sinks import create_sink, OrionSink
+from writebehind import WriteBehind
+from metrics import REGISTRY, TICK_SECONDS, ERRORS, QUEUE_DEPTH, RUNWAY_QUEUE_LENGTH, ENTITIES, FLIGHTS
+
+# Worker processes the fleet is split across; 0 or 1 keeps it in the main process
+SHARDS = int(os.getenv('SIM_SHARDS', '0'))
+
+# What flights are assigned to shards by: their ID, or their origin airport,
+# which keeps all the departures of an airport in one worker
+SHARD_KEYS = ['flight', 'airport']
+SHARD_BY = os.getenv('SIM_SHARD_BY', 'flight')
+
+# Shard owning a key. Python's hash() of a string differs between
+# processes, so the key is hashed with crc32 instead.
+def shard_of(key, shards):
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+# Flights the coordinator generates before dealing them out to the shards
+DEAL_SIZE = 1000
+
+# Output file of one shard for file sinks: updates.ndjson.gz -> updates-shard1.ndjson.gz
+def shard_path(path, index):
+    if path == os.devnull:
+        return path
+    directory, name = os.path.split(path)
+    stem, dot, extension = name.partition('.')
+    return os.path.join(directory, f"{stem}-shard{index}{dot}{extension}")
+
+# The flights of one shard, owned by a worker process with its own sink and
+# Orion connection pool. The shard's flights are those the coordinator dealt
+# it, streamed in as they are generated. Runway queues cover the shard's
+# flights only, against replicas of every airport's runways kept in step by
+# the coordinator, and the flights fly through a replica of its weather grid.
+#
+# settings holds the simulator options the workers share: airports,
+# shard_by, start, runways (normalized NGSI), weather (grid fields),
+# orion_url, sink, sink_path, compress, key_values, profile, encode,
+# write_behind, writers and seed, from which each shard seeds its fleet's
+# random generator (None for an unseeded one).
+class Shard:
+    def __init__(self, index, settings, flights):
+        set_profile(settings['profile'])
+        self.index = index
+        self.encode = settings['encode']
+        self.timestamp = settings['start'].isoformat()
+        self.flights = {}
+        self.runways = {runway.id: runway for runway in map(RunwayStatus.from_ngsi, settings['runways'])}
+        self.sequencer = NetworkSequencer(settings['airports'], self.runways.values(), self.flights)
+        self.weather = WeatherGrid(settings['airports'])
+        self.weather.load(settings['weather'])
+        self.writer = None
+
+        client = get_client(settings['orion_url'])
+        self.sink = create_sink(settings['sink'], shard_path(settings['sink_path'], index), settings['compress'],
+                                lambda: self.timestamp, client, settings['key_values'])
+
+        # Assign each of the shard's flights a runway and stream them into the sink
+        def assigned_flights():
+            for flight in flights:
+                if self.sequencer.update_flight(flight) is None:
+                    # Departures already airborne took off from a departure runway
+                    flight.assignedRunway = self.sequencer.pick_runway('departure', flight.origin)
+                self.flights[flight.id] = flight
+                yield flight.to_ngsi()
+
+        bootstrap(assigned_flights(), self.batch_update)
+        seed = settings.get('seed')
+        self.fleet = FleetEngine(self.flights.values(), settings['airports'],
+                                 seed=None if seed is None else (seed, index))
+
+        if settings['write_behind']:
+            client.set_pool_size(settings['writers'])
+            self.writer = WriteBehind(self.sink.batch, settings['writers'])
+
+        ENTITIES.set_function(lambda: {Flight.TYPE: len(self.flights)})
+        FLIGHTS.set_function(self.count_flights)
+        RUNWAY_QUEUE_LENGTH.set_function(self.count_runway_queues)
+        QUEUE_DEPTH.set_function(self.count_queues)
+
+    def count_flights(self):
+        counts = np.bincount(self.fleet.status, minlength=len(STATUSES)).tolist()
+        return dict(zip(STATUSES, counts))
+
+    def count_runway_queues(self):
+        return {(runway_id, kind): len(queue) for runway_id, queues in self.sequencer.queues.items()
+                for kind, queue in queues.items()}
+
+    def count_queues(self):
+        return {
+            'write_behind': len(self.writer) if self.writer is not None else 0,
+            'resync': len(self.sink.backlog) if isinstance(self.sink, OrionSink) else 0
+        }
+
+    def batch_update(self, entities, action_type='append', batch_size=None):
+        if self.writer is not None:
+            self.writer.put(entities, action_type)
+        else:
+            self.sink.batch(entities, action_type, batch_size)
+
+    # Advance the shard's flights by one tick. Returns their positions when
+    # the coordinator checks separation, with the shard's metrics, and the
+    # changed flights to write.
+    def tick_flights(self, timestamp, positions):
+        self.timestamp = timestamp
+        with TICK_SECONDS.time('shard'):
+            fleet = self.fleet
+            fleet.step(self.weather)
+            status_changed = [fleet.flights[row] for row in np.flatnonzero(fleet.dirty['status']).tolist()]
+            changes = fleet.emit(timestamp, self.encode)
+
+            # Flights cleared to land leave their runway's arrival queue
+            for flight in status_changed:
+                self.sequencer.update_flight(flight, timestamp)
+
+        arrays = (fleet.lat, fleet.lng, fleet.altitude, fleet.status) if positions else None
+        return (arrays, REGISTRY.collect()), changes
+
+    # Take the coordinator's weather grid after a weather tick
+    def update_weather(self, fields):
+        self.weather.load(fields)
+        return None, []
+
+    # Bring the runway replicas in line with the coordinator's runways and
+    # move flights off runways that closed or switched operation. Returns
+    # the heads of the shard's runway queues and the moved flights to write.
+    def update_runways(self, timestamp, runways):
+        self.timestamp = timestamp
+        for data in runways:
+            state = RunwayStatus.from_ngsi(data)
+            runway = self.runways[state.id]
+            for name in RunwayStatus.NAMES:
+                setattr(runway, name, getattr(state, name))
+
+        changes = []
+        for flight_id in self.sequencer.update_runways(timestamp):
+            flight_changes = self.flights[flight_id].pop_changes(self.encode)
+            if flight_changes:
+                changes.append(flight_changes)
+        return self.sequencer.heads(), changes
+
+    # Send the queued writes and close the sink
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer.report()
+        self.sink.close()
+
+# Flights the coordinator deals a worker, in lists ending with None
+def dealt_flights(connection):
+    while True:
+        flights = connection.recv()
+        if flights is None:
+            return
+        yield from flights
+
+# Worker process of one shard: build the shard from the flights it is dealt,
+# then run the coordinator's (command, *args) messages until told to stop. Each command is answered
+# with (error, result) before the shard's writes for it are sent, so the
+# writes overlap with the other shards and with the coordinator.
+def run_shard(index, settings, connection):
+    # Ctrl+C reaches every process in the group; the coordinator stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        shard = Shard(index, settings, dealt_flights(connection))
+    except Exception as e:
+        connection.send((f"{type(e).__name__}: {e}", None))
+        return
+    connection.send((None, (shard.fleet.ids, shard.sequencer.heads())))
+
+    while True:
+        try:
+            command, *args = connection.recv()
+        except EOFError:
+            shard.close()
+            return
+        if command == 'stop':
+            shard.close()
+            connection.send((None, REGISTRY.collect()))
+            return
+
+        try:
+            result, changes = getattr(shard, command)(*args)
+        except Exception as e:
+            ERRORS.inc('shard')
+            connection.send((f"{type(e).__name__}: {e}", None))
+            continue
+        connection.send((None, result))
+
+        try:
+            shard.batch_update(changes)
+        except Exception as e:
+            ERRORS.inc('shard')
+            print(f"Error writing shard {index}: {e}")
+
+# Positions of the whole fleet gathered from the shards, shard after shard,
+# in the arrays of a FleetEngine that SeparationMonitor reads
+class ShardedFleet:
+    def __init__(self, ids):
+        self.ids = ids
+        self.lat = self.lng = np.empty(0)
+        self.altitude = np.empty(0, dtype=np.int64)
+        self.status = np.empty(0, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, positions):
+        self.lat, self.lng, self.altitude, self.status = (np.concatenate(arrays) for arrays in zip(*positions))
+
+# Coordinator side of a sharded simulation. Starts one worker process per
+# shard and sends every command to all of them at once, waiting for all the
+# answers. The coordinator generates the fleet once and deals each flight to
+# the shard its ID, or origin airport, hashes to, DEAL_SIZE flights at a
+# time, so no process ever holds more than its own share of the fleet. The
+# runways and weather of every airport stay with the coordinator, which sends
+# the runway state and the weather grid to the workers, merges their runway
+# queue heads for the published sequences and their metrics into its own
+# registry. Workers are spawned rather than forked, so none of them inherits
+# the coordinator's Orion connections.
+class ShardPool:
+    def __init__(self, shards, settings, flights):
+        context = multiprocessing.get_context('spawn')
+        self.lock = threading.Lock()
+        self.closed = False
+        self.connections = []
+        self.processes = []
+        for index in range(shards):
+            connection, child = context.Pipe()
+            process = context.Process(target=run_shard, args=(index, settings, child),
+                                      name=f"shard-{index}", daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        self._deal(flights, settings['shard_by'] == 'airport')
+        ids, heads = zip(*self._receive())
+        self.fleet = ShardedFleet([flight_id for shard_ids in ids for flight_id in shard_ids])
+        self.heads = merge_heads(heads)
+
+    def __len__(self):
+        return len(self.fleet)
+
+    # Send every flight to its shard while the shards bootstrap them. A shard
+    # that failed to start stops reading; its error is in its first answer.
+    def _deal(self, flights, by_origin):
+        shards = len(self.connections)
+        failed = set()
+
+        def send(index, message):
+            if index in failed:
+                return
+            try:
+                self.connections[index].send(message)
+            except OSError:
+                failed.add(index)
+
+        for chunk in chunked(flights, DEAL_SIZE):
+            shares = [[] for _ in range(shards)]
+            for flight in chunk:
+                shares[shard_of(flight.origin if by_origin else flight.id, shards)].append(flight)
+            for index, share in enumerate(shares):
+                if share:
+                    send(index, share)
+        for index in range(shards):
+            send(index, None)
+
+    # One answer per shard, raising if any of them failed
+    def _receive(self):
+        results, errors = [], []
+        for index, connection in enumerate(self.connections):
+            error, result = connection.recv()
+            if error is not None:
+                errors.append(f"shard {index}: {error}")
+            results.append(result)
+        if errors:
+            raise RuntimeError('; '.join(errors))
+        return results
+
+    def _call(self, command, *args):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Shards are stopped")
+            for connection in self.connections:
+                connection.send((command, *args))
+            return self._receive()
+
+    # Advance every shard by one flight tick. With positions, returns the
+    # ShardedFleet holding the positions of the whole fleet after the tick.
+    def tick_flights(self, timestamp, positions=False):
+        results = self._call('tick_flights', timestamp, positions)
+        for index, (_, metrics) in enumerate(results):
+            REGISTRY.merge(f"shard-{index}", metrics)
+        if not positions:
+            return None
+        self.fleet.update([arrays for arrays, _ in results])
+        return self.fleet
+
+    # Send the weather grid fields to every shard
+    def update_weather(self, fields):
+        self._call('update_weather', fields)
+
+    # Send the runway state to every shard and return the merged heads of
+    # their runway queues
+    def update_runways(self, timestamp, runways):
+        self.heads = merge_heads(self._call('update_runways', timestamp, runways))
+        return self.heads
+
+    # Stop the workers once they have sent their queued writes
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for connection in self.connections:
+                try:
+                    connection.send(('stop',))
+                except OSError:
+                    pass
+            for index, connection in enumerate(self.connections):
+                try:
+                    _, metrics = connection.recv()
+                    REGISTRY.merge(f"shard-{index}", metrics)
+                except (EOFError, OSError) as e:
+                    print(f"Shard {index} did not stop cleanly: {e}")
+        for process in self.processes:
+            process.join()
@@ -3,21 +3,27 @@ import os
 import json
 import time
 import random
-import requests
+import argparse
 import datetime
 from math import sin, cos, radians
+from orion_client import get_client
+from entities import Flight, RunwayStatus, WeatherCondition
+from serializer import Template
+from profiler import Profiler, PROFILE_DIR, PROFILE_WINDOW, PROFILE_WINDOWS, PROFILE_TOP
 
 # Configuration
 ORION_URL = os.getenv('ORION_URL', 'http://localhost:1026')
-FIWARE_SERVICE = 'airport'
-FIWARE_SERVICE_PATH = '/'
 
-# Headers for API requests
-HEADERS = {
-    'Content-Type': 'application/json',
-    'fiware-service': FIWARE_SERVICE,
-    'fiware-servicepath': FIWARE_SERVICE_PATH
-}
+# Shared pooled client
+client = get_client(ORION_URL)
+
+# Precompiled /attrs bodies; each update only fills in the values and one
+# timestamp shared by all its attributes
+FLIGHT_UPDATE = Template(Flight, ('status', 'position', 'altitude', 'speed', 'heading'), with_id=False)
+WEATHER_UPDATE = Template(WeatherCondition, ('temperature', 'windSpeed', 'windDirection', 'visibility',
+                                             'precipitation', 'cloudCoverage', 'condition', 'weatherAlert'),
+                          with_id=False)
+RUNWAY_UPDATE = Template(RunwayStatus, ('status', 'operation', 'surfaceCondition', 'currentCapacity'), with_id=False)
 
 def get_timestamp():
     return datetime.datetime.now().isoformat()
@@ -36,67 +42,9 @@ def update_flight(flight_id):
     lat = center_lat + (radius * sin(angle))
     lon = center_lon + (radius * cos(angle))
 
-    data = {
-        "status": {
-            "value": status,
-            "type": "Text",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "position": {
-            "value": {
-                "type": "Point",
-                "coordinates": [lat, lon]
-            },
-            "type": "geo:json",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "altitude": {
-            "value": altitude,
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "speed": {
-            "value": speed,
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "heading": {
-            "value": heading,
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        }
-    }
+    data = FLIGHT_UPDATE.fill([status, (lat, lon), altitude, speed, heading], get_timestamp())
 
-    response = requests.patch(
-        f"{ORION_URL}/v2/entities/{flight_id}/attrs",
-        headers=HEADERS,
-        json=data
-    )
+    response = client.patch(f"/v2/entities/{flight_id}/attrs", data)
     
     print(f"Updated flight {flight_id}: {response.status_code}")
     return response.status_code == 204
@@ -123,94 +71,18 @@ def update_weather():
     # Set weather alert if conditions are severe
     weather_alert = wind_speed > 20 or visibility < 5 or precipitation > 3
 
-    data = {
-        "temperature": {
-            "value": round(temperature, 1),
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "windSpeed": {
-            "value": round(wind_speed, 1),
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "windDirection": {
-            "value": wind_direction,
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "visibility": {
-            "value": round(visibility, 1),
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "precipitation": {
-            "value": round(precipitation, 1),
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "cloudCoverage": {
-            "value": cloud_coverage,
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "condition": {
-            "value": condition,
-            "type": "Text",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "weatherAlert": {
-            "value": weather_alert,
-            "type": "Boolean",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        }
-    }
+    data = WEATHER_UPDATE.fill([
+        round(temperature, 1),
+        round(wind_speed, 1),
+        wind_direction,
+        round(visibility, 1),
+        round(precipitation, 1),
+        cloud_coverage,
+        condition,
+        weather_alert
+    ], get_timestamp())
 
-    response = requests.patch(
-        f"{ORION_URL}/v2/entities/WeatherCondition:Airport1/attrs",
-        headers=HEADERS,
-        json=data
-    )
+    response = client.patch("/v2/entities/WeatherCondition:Airport1/attrs", data)
     
     print(f"Updated weather: {response.status_code}")
     return response.status_code == 204
@@ -222,79 +94,62 @@ def update_runway(runway_id):
     surface_condition = random.choice(['dry', 'wet', 'snow', 'ice'])
     capacity = random.randint(60, 100) if status == 'active' else 0
 
-    data = {
-        "status": {
-            "value": status,
-            "type": "Text",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "operation": {
-            "value": operation,
-            "type": "Text",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "surfaceCondition": {
-            "value": surface_condition,
-            "type": "Text",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        },
-        "currentCapacity": {
-            "value": capacity,
-            "type": "Number",
-            "metadata": {
-                "timestamp": {
-                    "value": get_timestamp(),
-                    "type": "DateTime"
-                }
-            }
-        }
-    }
+    data = RUNWAY_UPDATE.fill([status, operation, surface_condition, capacity], get_timestamp())
 
-    response = requests.patch(
-        f"{ORION_URL}/v2/entities/RunwayStatus:{runway_id}/attrs",
-        headers=HEADERS,
-        json=data
-    )
+    response = client.patch(f"/v2/entities/RunwayStatus:{runway_id}/attrs", data)
     
     print(f"Updated runway {runway_id}: {response.status_code}")
     return response.status_code == 204
 
+# Update every flight, the weather and every runway once
+def update_entities(flights, runways):
+    print("\nUpdating entities...")
+    
+    # Update flights
+    for flight_id in flights:
+        update_flight(f"Flight:{flight_id}")
+    
+    # Update weather
+    update_weather()
+    
+    # Update runways
+    for runway_id in runways:
+        update_runway(runway_id)
+
 def main():
+    parser = argparse.ArgumentParser(description='Send periodic updates to the airport entities in Orion')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile each round of updates with cProfile and tracemalloc')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR,
+                        help='Directory for the .prof and .tracemalloc files of each profile window')
+    parser.add_argument('--profile-window', type=int, default=PROFILE_WINDOW,
+                        help='Rounds of updates per profile window')
+    parser.add_argument('--profile-windows', type=int, default=PROFILE_WINDOWS,
+                        help='Profile windows to record before profiling stops (0 for no limit)')
+    parser.add_argument('--profile-top', type=int, default=PROFILE_TOP,
+                        help='Entries listed in the profile summary on exit')
+    args = parser.parse_args()
+    if args.profile_window < 1:
+        parser.error('--profile-window must be at least 1')
+    if args.profile_windows < 0:
+        parser.error('--profile-windows cannot be negative')
+    
     print("Starting entity update simulation...")
     
     # Flight IDs to update
     flights = ['UA123', 'BA456', 'DL789', 'AA321']
     runways = ['RW27L', 'RW27R', 'RW09L', 'RW09R']
     
+    # Only profiled runs wrap the updates, so others pay nothing for it
+    update = update_entities
+    profiler = None
+    if args.profile:
+        profiler = Profiler(args.profile_dir, args.profile_window, args.profile_windows, args.profile_top)
+        update = profiler.wrap(update_entities)
+    
     try:
         while True:
-            print("\nUpdating entities...")
-            
-            # Update flights
-            for flight_id in flights:
-                update_flight(f"Flight:{flight_id}")
-            
-            # Update weather
-            update_weather()
-            
-            # Update runways
-            for runway_id in runways:
-                update_runway(runway_id)
+            update(flights, runways)
             
             print(f"Updates completed at {get_timestamp()}")
             print("Waiting 10 seconds for next update...")
@@ -304,6 +159,9 @@ def main():
         print("\nSimulation stopped by user")
     except Exception as e:
         print(f"Error in simulation: {e}")
+    finally:
+        if profiler is not None:
+            profiler.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+import os
+import io
+import sys
+import gzip
+import datetime
+import threading
+import requests
+from orion_client import get_client, BATCH_SIZE
+from circuit import CircuitOpenError
+from writebehind import PendingWrites
+from serializer import dumps, encode_item
+from metrics import ENTITY_WRITES, BYTES_SENT, RESYNCED, ERRORS
+
+# Output selection
+SINK = os.getenv('SIM_SINK', 'orion')
+SINK_PATH = os.getenv('SIM_SINK_PATH', 'updates.ndjson')
+SINK_BUFFER_SIZE = 1 << 20
+
+# Helper function to get current timestamp in ISO format
+def get_timestamp():
+    return datetime.datetime.now().isoformat()
+
+# Writes entities to a live Orion Context Broker. key_values sends every
+# request with options=keyValues, for entities in the keyValues payload profile.
+# create() and update() take entity dicts; batch() also takes JSON bytes.
+#
+# Writes that cannot reach Orion (connection errors, timeouts, 5xx responses
+# or an open circuit) are kept in a backlog holding the latest state of each
+# entity, instead of being retried one by one. While the backlog is not empty
+# new writes join it, and as soon as the client's circuit breaker lets a
+# request through again the whole backlog is resynced in one pass of bulk
+# /v2/op/update append batches, the first of which probes whether Orion is back.
+class OrionSink:
+    def __init__(self, client=None, key_values=False):
+        self.client = client or get_client()
+        self.params = {'options': 'keyValues'} if key_values else None
+        self.count = 0
+        self.backlog = PendingWrites()
+        self.backlog_lock = threading.Lock()
+        self.resync_lock = threading.Lock()
+
+    # Count the entity writes and body bytes of a request
+    def _record(self, op, count, response):
+        self.count += count
+        ENTITY_WRITES.inc('orion', op, amount=count)
+        BYTES_SENT.inc('orion', amount=len(response.request.body or b''))
+
+    # Keep writes that did not reach Orion for the next resync. Failed writes
+    # go back in front of the backlog, under any newer changes to the same entities.
+    def _defer(self, entities, action_type, failed=False):
+        with self.backlog_lock:
+            if failed:
+                self.backlog.restore(entities, action_type)
+            else:
+                self.backlog.add(entities, action_type)
+
+    # Create entity in Orion
+    def create(self, entity_data):
+        if self.backlog:
+            self.batch([entity_data], 'append')
+            return
+        try:
+            response = self.client.post("/v2/entities", entity_data, self.params)
+        except (CircuitOpenError, requests.RequestException):
+            self._defer([entity_data], 'append', failed=True)
+            return
+        self._record('create', 1, response)
+
+        if response.status_code == 201:
+            print(f"Entity {entity_data['id']} created successfully")
+        elif response.status_code == 422:
+            # Entity already exists, update it
+            self.update(entity_data)
+        elif response.status_code >= 500:
+            self._defer([entity_data], 'append', failed=True)
+        else:
+            ERRORS.inc('orion')
+            print(f"Failed to create entity {entity_data['id']}: {response.status_code} {response.text}")
+
+    # Update entity in Orion
+    def update(self, entity_data):
+        if self.backlog:
+            self.batch([entity_data], 'append')
+            return
+        entity_id = entity_data['id']
+
+        # Remove id and type from the payload
+        update_data = entity_data.copy()
+        update_data.pop('id', None)
+        update_data.pop('type', None)
+
+        try:
+            response = self.client.patch(f"/v2/entities/{entity_id}/attrs", update_data, self.params)
+        except (CircuitOpenError, requests.RequestException):
+            self._defer([entity_data], 'append', failed=True)
+            return
+        self._record('update', 1, response)
+
+        if response.status_code == 204:
+            print(f"Entity {entity_id} updated successfully")
+        elif response.status_code >= 500:
+            self._defer([entity_data], 'append', failed=True)
+        else:
+            ERRORS.inc('orion')
+            print(f"Failed to update entity {entity_id}: {response.status_code} {response.text}")
+
+    # Send entities in chunked /v2/op/update requests. Returns False when
+    # Orion could not be reached, after deferring the unsent entities.
+    def _send(self, entities, action_type, batch_size=None):
+        batch_size = batch_size or BATCH_SIZE
+        for start in range(0, len(entities), batch_size):
+            chunk = entities[start:start + batch_size]
+            try:
+                (_, response), = self.client.batch_update(chunk, action_type, batch_size, self.params)
+            except (CircuitOpenError, requests.RequestException):
+                self._defer(entities[start:], action_type, failed=True)
+                return False
+            self._record(action_type, len(chunk), response)
+            if response.status_code == 204:
+                print(f"Batch {action_type} of {len(chunk)} entities completed successfully")
+            elif response.status_code >= 500:
+                self._defer(entities[start:], action_type, failed=True)
+                return False
+            else:
+                ERRORS.inc('orion')
+                print(f"Failed batch {action_type} of {len(chunk)} entities: {response.status_code} {response.text}")
+        return True
+
+    # Write the whole backlog in one pass once the circuit lets requests
+    # through. Only one thread resyncs at a time; the others leave their
+    # writes in the backlog for it.
+    def resync(self, batch_size=None):
+        if not self.client.breaker.ready() or not self.resync_lock.acquire(blocking=False):
+            return
+        try:
+            while self.backlog and self.client.breaker.ready():
+                with self.backlog_lock:
+                    batches = self.backlog.take(len(self.backlog))
+                count = sum(len(entities) for entities in batches.values())
+                print(f"Resyncing {count} entities changed while Orion was unavailable")
+                batches = list(batches.items())
+                for i, (action_type, entities) in enumerate(batches):
+                    if self._send(entities, action_type, batch_size):
+                        RESYNCED.inc(amount=len(entities))
+                        continue
+                    # Orion is still down: keep the rest for the next attempt
+                    for rest_type, rest in batches[i + 1:]:
+                        self._defer(rest, rest_type, failed=True)
+                    break
+        finally:
+            self.resync_lock.release()
+
+    # Update several entities in Orion, behind the backlog if there is one
+    def batch(self, entities, action_type='update', batch_size=None):
+        if self.backlog:
+            self._defer(entities, action_type)
+            self.resync(batch_size)
+            return
+        self._send(entities, action_type, batch_size)
+
+    # Try once more to write the backlog before shutting down
+    def close(self):
+        if self.backlog:
+            self.resync()
+            if self.backlog:
+                print(f"{len(self.backlog)} entity changes could not be written to Orion")
+
+# Writes one JSON record per entity write to a text stream:
+# {"time": <simulated timestamp>, "op": "create"|"update"|"append"|"delete", "entity": {...}}
+# Entities may be dicts or JSON bytes, which are copied into the record as they are.
+class StreamSink:
+    NAME = 'stream'
+
+    def __init__(self, stream, timestamp=None):
+        self.stream = stream
+        self.timestamp = timestamp or get_timestamp
+        self.count = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def _write(self, op, entities):
+        prefix = b'{"time":' + dumps(self.timestamp()) + b',"op":' + dumps(op) + b',"entity":'
+        records = [prefix + encode_item(entity) + b'}\n' for entity in entities]
+        lines = [record.decode('utf-8') for record in records]
+        with self.lock:
+            if self.closed:
+                return
+            self.stream.writelines(lines)
+            self.count += len(lines)
+        ENTITY_WRITES.inc(self.NAME, op, amount=len(lines))
+        BYTES_SENT.inc(self.NAME, amount=sum(len(record) for record in records))
+
+    def create(self, entity_data):
+        self._write('create', [entity_data])
+
+    def update(self, entity_data):
+        self._write('update', [entity_data])
+
+    def batch(self, entities, action_type='update', batch_size=None):
+        self._write(action_type, entities)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.stream.flush()
+
+# Writes records to the standard output the sink was created with. For the
+# output to stay valid NDJSON that replay.py can read, whatever else the
+# process prints has to go elsewhere; the simulator sends it to standard error.
+class StdoutSink(StreamSink):
+    NAME = 'stdout'
+
+    def __init__(self, timestamp=None):
+        super().__init__(sys.stdout, timestamp)
+
+# Writes records to a buffered NDJSON file, gzip-compressed when asked to or
+# when the path ends in .gz
+class NdjsonSink(StreamSink):
+    NAME = 'ndjson'
+
+    def __init__(self, path=SINK_PATH, compress=False, timestamp=None):
+        self.path = path
+        if compress or path.endswith('.gz'):
+            stream = io.TextIOWrapper(io.BufferedWriter(gzip.open(path, 'wb'), SINK_BUFFER_SIZE), encoding='utf-8')
+        else:
+            stream = open(path, 'w', buffering=SINK_BUFFER_SIZE, encoding='utf-8')
+        super().__init__(stream, timestamp)
+
+    def close(self):
+        super().close()
+        self.stream.close()
+
+# Discards every write, only counting entities
+class NullSink:
+    def __init__(self):
+        self.count = 0
+
+    def create(self, entity_data):
+        self.count += 1
+        ENTITY_WRITES.inc('null', 'create')
+
+    def update(self, entity_data):
+        self.count += 1
+        ENTITY_WRITES.inc('null', 'update')
+
+    def batch(self, entities, action_type='update', batch_size=None):
+        self.count += len(entities)
+        ENTITY_WRITES.inc('null', action_type, amount=len(entities))
+
+    def close(self):
+        pass
+
+SINKS = ['orion', 'ndjson', 'stdout', 'null']
+
+# Build a sink by name
+def create_sink(name=SINK, path=SINK_PATH, compress=False, timestamp=None, client=None, key_values=False):
+    if name == 'orion':
+        return OrionSink(client, key_values)
+    if name == 'ndjson':
+        return NdjsonSink(path, compress, timestamp)
+    if name == 'stdout':
+        return StdoutSink(timestamp)
+    if name == 'null':
+        return NullSink()
+    raise ValueError(f"Unknown sink: {name}. Available sinks: {', '.join(SINKS)}")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import os
+import math
+import numpy as np
+
+# Grid spacing and the margin the grid extends beyond the outermost
+# airports, both in degrees
+GRID_CELL = float(os.getenv('WEATHER_GRID_CELL', '0.25'))
+GRID_MARGIN = float(os.getenv('WEATHER_GRID_MARGIN', '2'))
+
+# Grid points on each side of an airport's nearest one that are averaged
+# into its WeatherCondition
+AIRPORT_RADIUS = int(os.getenv('WEATHER_AIRPORT_RADIUS', '1'))
+
+# Fields of the grid. Wind is stored as the east and north components of
+# the air's motion in knots, so it can be interpolated and averaged;
+# visibility is derived from the cloud coverage.
+FIELDS = ('temperature', 'windU', 'windV', 'precipitation', 'cloudCoverage', 'visibility')
+
+# Per-tick perturbations of the evolved fields: (probability, low, high)
+PERTURBATIONS = {
+    'temperature': (0.2, -0.5, 0.5),
+    'windU': (0.2, -1.0, 1.0),
+    'windV': (0.2, -1.0, 1.0),
+    'precipitation': (0.1, -0.2, 0.2),
+    'cloudCoverage': (0.1, -5.0, 5.0)
+}
+
+# Share of each grid point's value that moves towards the mean of its
+# neighbours every tick, so nearby points drift together into weather systems
+DIFFUSION = 0.1
+
+# Conditions by cloud coverage below each bound, with their visibility in km
+CONDITIONS = [(20, 'clear', 10), (50, 'partly cloudy', 8), (80, 'cloudy', 6), (math.inf, 'rain', 4)]
+
+# Severe weather thresholds raising a weatherAlert
+ALERT_WIND_SPEED = 25
+ALERT_PRECIPITATION = 5
+
+# East and north wind components for a wind blowing from a compass direction
+def wind_components(speed, direction):
+    direction = math.radians(direction)
+    return -speed * math.sin(direction), -speed * math.cos(direction)
+
+# Condition name and visibility for a cloud coverage
+def condition(cloud_coverage):
+    for bound, name, visibility in CONDITIONS:
+        if cloud_coverage < bound:
+            return name, visibility
+
+# Mean of the four neighbours of every grid point, repeating the edges
+def _neighbour_mean(field):
+    padded = np.pad(field, 1, mode='edge')
+    return (padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:]) / 4
+
+# Weather over a lat/lng box around the simulated airports, as one NumPy
+# array per field with a point every `cell` degrees. Each weather tick
+# perturbs and diffuses the whole grid in a few vectorized operations.
+# Flights read it with sample(), by bilinear interpolation at their
+# positions; each airport's WeatherCondition is the mean of the grid
+# points around the field. The grid starts out with every point taking the
+# weather of its nearest airport.
+class WeatherGrid:
+    def __init__(self, airports, weather=None, cell=GRID_CELL, margin=GRID_MARGIN,
+                 radius=AIRPORT_RADIUS, seed=None):
+        lats = [airport.location[0] for airport in airports.values()]
+        lngs = [airport.location[1] for airport in airports.values()]
+        self.cell = cell
+        self.lat0 = math.floor((min(lats) - margin) / cell) * cell
+        self.lng0 = math.floor((min(lngs) - margin) / cell) * cell
+        rows = max(math.ceil((max(lats) + margin - self.lat0) / cell) + 1, 2)
+        cols = max(math.ceil((max(lngs) + margin - self.lng0) / cell) + 1, 2)
+        self.shape = (rows, cols)
+        self.rng = np.random.default_rng(seed)
+
+        # Grid points around each airport, by airport code
+        self.areas = {}
+        for code, airport in airports.items():
+            row = round((airport.location[0] - self.lat0) / cell)
+            col = round((airport.location[1] - self.lng0) / cell)
+            self.areas[code] = (slice(max(row - radius, 0), row + radius + 1),
+                                slice(max(col - radius, 0), col + radius + 1))
+
+        self.fields = self._seed(airports, weather or {})
+
+    # Fields with every grid point set to the weather of its nearest airport
+    def _seed(self, airports, weather):
+        lat = self.lat0 + np.arange(self.shape[0]) * self.cell
+        lng = self.lng0 + np.arange(self.shape[1]) * self.cell
+        distances = [(lat[:, None] - airport.location[0]) ** 2 + (lng[None, :] - airport.location[1]) ** 2
+                     for airport in airports.values()]
+        nearest = np.argmin(distances, axis=0)
+
+        values = {name: [] for name in FIELDS}
+        for code, airport in airports.items():
+            current = weather.get(code) or airport.create_weather(None)
+            u, v = wind_components(current.windSpeed or 0, current.windDirection or 0)
+            values['temperature'].append(current.temperature or 0)
+            values['windU'].append(u)
+            values['windV'].append(v)
+            values['precipitation'].append(current.precipitation or 0)
+            values['cloudCoverage'].append(current.cloudCoverage or 0)
+            values['visibility'].append(condition(current.cloudCoverage or 0)[1])
+        return {name: np.array(airport_values, dtype=np.float64)[nearest] for name, airport_values in values.items()}
+
+    # Grid position, for telling whether saved fields fit this grid
+    def geometry(self):
+        return {'lat0': self.lat0, 'lng0': self.lng0, 'cell': self.cell, 'shape': list(self.shape)}
+
+    # Replace the fields, e.g. with the coordinator's after a weather tick
+    def load(self, fields):
+        self.fields = {name: np.asarray(fields[name], dtype=np.float64) for name in FIELDS}
+
+    # Evolve the whole grid by one weather tick
+    def step(self):
+        rng = self.rng
+        fields = self.fields
+        for name, (probability, low, high) in PERTURBATIONS.items():
+            change = np.where(rng.random(self.shape) < probability, rng.uniform(low, high, self.shape), 0.0)
+            field = fields[name] + change
+            fields[name] = (1 - DIFFUSION) * field + DIFFUSION * _neighbour_mean(field)
+
+        np.clip(fields['cloudCoverage'], 0, 100, out=fields['cloudCoverage'])
+        np.maximum(fields['precipitation'], 0, out=fields['precipitation'])
+        cloud = fields['cloudCoverage']
+        fields['visibility'] = np.select([cloud < bound for bound, _, _ in CONDITIONS[:-1]],
+                                         [visibility for _, _, visibility in CONDITIONS[:-1]],
+                                         CONDITIONS[-1][2]).astype(np.float64)
+
+    # Fields at arbitrary positions by bilinear interpolation between the
+    # four surrounding grid points. Positions off the grid take the value
+    # at its nearest edge.
+    def sample(self, lat, lng, names=FIELDS):
+        rows, cols = self.shape
+        y = np.clip((np.asarray(lat) - self.lat0) / self.cell, 0, rows - 1)
+        x = np.clip((np.asarray(lng) - self.lng0) / self.cell, 0, cols - 1)
+        i = np.minimum(y.astype(np.intp), rows - 2)
+        j = np.minimum(x.astype(np.intp), cols - 2)
+        fy = y - i
+        fx = x - j
+
+        # Flat indices and weights of the four corners
+        corner = i * cols + j
+        corners = (corner, corner + 1, corner + cols, corner + cols + 1)
+        weights = ((1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx)
+
+        samples = {}
+        for name in names:
+            field = self.fields[name].ravel()
+            samples[name] = sum(field[index] * weight for index, weight in zip(corners, weights))
+        return samples
+
+    # Mean of every field over the grid points around an airport
+    def aggregate(self, code):
+        area = self.areas[code]
+        return {name: float(self.fields[name][area].mean()) for name in FIELDS}
+
+    # Set an airport's WeatherCondition to the aggregate of its grid points
+    def apply(self, code, weather, timestamp):
+        values = self.aggregate(code)
+        u, v = values['windU'], values['windV']
+        cloud_coverage = round(values['cloudCoverage'])
+        wind_speed = round(math.hypot(u, v), 1)
+        precipitation = round(values['precipitation'], 1)
+
+        weather.set('temperature', round(values['temperature'], 1), timestamp)
+        weather.set('windSpeed', wind_speed, timestamp)
+        weather.set('windDirection', round(math.degrees(math.atan2(-u, -v))) % 360, timestamp)
+        weather.set('cloudCoverage', cloud_coverage, timestamp)
+        weather.set('precipitation', precipitation, timestamp)
+        weather.set('condition', condition(cloud_coverage)[0], timestamp)
+        weather.set('weatherAlert', wind_speed > ALERT_WIND_SPEED or precipitation > ALERT_PRECIPITATION, timestamp)
+        weather.set('visibility', round(values['visibility'], 1), timestamp)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import os
+import time
+import threading
+from collections import OrderedDict
+from orion_client import BATCH_SIZE, POOL_SIZE
+from serializer import entity_id, merge_payloads
+from metrics import COALESCED, ERRORS
+
+# Route tick writes through the coalescing write-behind queue, and how many
+# sender threads drain it
+WRITE_BEHIND = os.getenv('SIM_WRITE_BEHIND', '0') == '1'
+WRITERS = int(os.getenv('SIM_WRITERS', str(POOL_SIZE)))
+
+# Seconds a sender waits after a failed write before taking more
+RETRY_DELAY = float(os.getenv('SIM_WRITE_RETRY_DELAY', '1'))
+
+# Combine two pending writes to the same entity into one (action_type, payload).
+# A delete replaces whatever was pending, and any write after a delete
+# replaces it; otherwise the newer attributes are merged over the older ones,
+# as an append if either write was one so that the entity is still created.
+def combine_writes(older_type, older, newer_type, newer):
+    if older_type == 'delete' or newer_type == 'delete':
+        return newer_type, newer
+    action_type = 'append' if 'append' in (older_type, newer_type) else newer_type
+    return action_type, merge_payloads(older, newer)
+
+# Pending entity writes, oldest first, with at most one write per entity, so
+# the writes to an entity can never be sent out of order. Callers hold their
+# own lock.
+class PendingWrites:
+    def __init__(self):
+        self.writes = OrderedDict()
+
+    def __len__(self):
+        return len(self.writes)
+
+    # Add entity payloads (dicts or JSON bytes), combining each with a pending
+    # write to the same entity, which keeps its place. Returns the number of
+    # writes combined.
+    def add(self, entities, action_type):
+        merged = 0
+        for entity in entities:
+            key = entity_id(entity)
+            older = self.writes.get(key)
+            if older is None:
+                self.writes[key] = (action_type, entity)
+            else:
+                self.writes[key] = combine_writes(*older, action_type, entity)
+                merged += 1
+        return merged
+
+    # Put writes that could not be sent back at the front, under any newer
+    # writes to the same entities added in the meantime
+    def restore(self, entities, action_type):
+        for entity in reversed(entities):
+            key = entity_id(entity)
+            newer = self.writes.get(key)
+            self.writes[key] = (action_type, entity) if newer is None else combine_writes(action_type, entity, *newer)
+            self.writes.move_to_end(key, last=False)
+
+    # Remove up to `count` of the oldest writes, grouped by action type.
+    # Writes to the entity IDs in `busy` stay queued in their place.
+    def take(self, count, busy=()):
+        keys = []
+        for key in self.writes:
+            if len(keys) >= count:
+                break
+            if key not in busy:
+                keys.append(key)
+
+        batches = {}
+        for key in keys:
+            action_type, entity = self.writes.pop(key)
+            batches.setdefault(action_type, []).append(entity)
+        return batches
+
+# Latest-wins write-behind stage between the simulation engines and the sink.
+# put() never blocks: it keeps at most one pending write per entity, merging
+# the attributes of a newer update over the pending one, so an entity that
+# changes again before it was sent keeps its place in the queue and is only
+# sent once, with its freshest state; a delete replaces the pending write,
+# and a write after a delete replaces it. `workers` sender threads drain the
+# queue oldest first in batches of batch_size through send(entities,
+# action_type, batch_size). An entity with a write in flight is skipped until
+# that write completes, so two senders never race writes to the same entity
+# and the newest state always lands last. Writes that fail go back in front
+# of the queue. When the sink slows down, updates coalesce instead of piling
+# up, and the queue never holds more than one write per entity.
+class WriteBehind:
+    def __init__(self, send, workers=WRITERS, batch_size=BATCH_SIZE):
+        self.send = send
+        self.batch_size = batch_size
+        self.pending = PendingWrites()
+        self.in_flight = set()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.threads = [threading.Thread(target=self._run, name=f"writer-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # Writes waiting to be sent
+    def __len__(self):
+        return len(self.pending)
+
+    # Queue entity payloads (dicts or JSON bytes) for writing with action_type
+    def put(self, entities, action_type='append'):
+        if not entities:
+            return
+        with self.condition:
+            if self.closed:
+                return
+            merged = self.pending.add(entities, action_type)
+            if merged:
+                self.coalesced += merged
+                COALESCED.inc(amount=merged)
+            self.queued += len(entities)
+            # Wake one sender per batch waiting
+            self.condition.notify(-(-len(self.pending) // self.batch_size))
+
+    # Take up to batch_size of the oldest writes to entities without a write
+    # in flight, grouped by action type, and mark those entities in flight;
+    # returns None once closed and drained
+    def _take(self):
+        with self.condition:
+            while True:
+                if not self.pending and self.closed:
+                    return None
+                batches = self.pending.take(self.batch_size, self.in_flight)
+                if batches:
+                    break
+                self.condition.wait()
+            for entities in batches.values():
+                self.in_flight.update(entity_id(entity) for entity in entities)
+            return batches
+
+    def _run(self):
+        while True:
+            batches = self._take()
+            if batches is None:
+                return
+            sent = 0
+            failed = {}
+            for action_type, entities in batches.items():
+                try:
+                    self.send(entities, action_type, self.batch_size)
+                    sent += len(entities)
+                except Exception as e:
+                    ERRORS.inc('write')
+                    print(f"Error writing {len(entities)} entities: {e}")
+                    failed[action_type] = entities
+
+            with self.condition:
+                self.sent += sent
+                # Failed writes are retried, merged under newer changes, until the queue is closed
+                for action_type, entities in failed.items():
+                    if self.closed:
+                        print(f"Dropping {len(entities)} unsent entities on close")
+                    else:
+                        self.pending.restore(entities, action_type)
+                for entities in batches.values():
+                    self.in_flight.difference_update(entity_id(entity) for entity in entities)
+                self.condition.notify_all()
+            if failed:
+                time.sleep(RETRY_DELAY)
+
+    # Send the remaining writes and stop the sender threads. Writes queued
+    # after this are dropped.
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def report(self):
+        print(f"write-behind: {self.queued} updates queued, {self.coalesced} coalesced, {self.sent} entities sent")